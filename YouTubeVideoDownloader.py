@@ -1,36 +1,129 @@
-import csv
-import yt_dlp
 import os
-import subprocess
-import datetime
-import re
 import tkinter as tk
 from tkinter import filedialog, ttk, messagebox
-import shutil
 import threading
-import queue
-import glob
-from concurrent.futures import ThreadPoolExecutor
-
-
-class DownloadTask:
-    def __init__(self, url, title, save_path, speaker, sermon_series, year, index):
-        self.url = url
-        self.title = title
-        self.save_path = save_path
-        self.speaker = speaker
-        self.sermon_series = sermon_series
-        self.year = year
-        self.index = index
-        self.process = None
-        self.paused = False
-        self.terminated = False
-        self.progress = 0
-        self.eta = "N/A"
-        self.status = "Pending"
-        self.filename = None
-        self.partial_file = None  # Track partial download file
-        self.downloaded_bytes = 0  # Track downloaded bytes for resuming
+
+from download_engine import DownloadEngine, RowStore, ffmpeg_available, prewarm
+
+
+# Download profiles offered for rows without a Profile column
+PROFILE_CHOICES = ["original", "video-720", "video-480", "audio"]
+# Download queue orders; dragging a row in the table switches to "manual"
+SCHEDULING_CHOICES = ["csv", "longest", "newest", "priority", "manual"]
+# Label text, status, progress, button state, pause button text
+IDLE_SLOT_STATE = ("No task", "Idle", 0, "disabled", "Pause")
+
+
+class UIUpdateStore:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.published = 0
+        self.dropped = 0  # Updates overwritten by a newer one before the GUI drained them
+
+    def publish(self, key, value):
+        with self.lock:
+            self.published += 1
+            if key in self.pending:
+                self.dropped += 1
+            self.pending[key] = value
+
+    def drain(self):
+        with self.lock:
+            pending, self.pending = self.pending, {}
+        return pending
+
+
+class VirtualTable:
+    # Shows a RowStore through a Treeview that only ever holds the rows currently on screen
+    def __init__(self, tree, scrollbar, on_reorder=None):
+        self.tree = tree
+        self.scrollbar = scrollbar
+        self.rows = RowStore()
+        self.first = 0  # Display position shown in the top item
+        self.items = []  # Treeview item IDs, one per visible line
+        # Row index at each display position and its inverse; None until a row is dragged, meaning CSV order
+        self.order = None
+        self.positions = None
+        self.on_reorder = on_reorder  # Called with the new order after a drag
+        self.drag_from = None
+        self.row_height = ttk.Style().lookup("Treeview", "rowheight") or 20
+        self.scrollbar.configure(command=self.yview)
+        self.tree.bind("<Configure>", lambda e: self.render())
+        self.tree.bind("<MouseWheel>", lambda e: self.scroll(int(-1 * (e.delta / 120))))
+        self.tree.bind("<ButtonPress-1>", self.start_drag)
+        self.tree.bind("<ButtonRelease-1>", self.finish_drag)
+
+    def set_rows(self, rows):
+        self.rows = rows
+        self.first = 0
+        self.reset_order()
+
+    def reset_order(self):
+        self.order = None
+        self.positions = None
+        self.render()
+
+    def position_at(self, y):
+        item = self.tree.identify_row(y)
+        if item not in self.items:
+            return None
+        return self.first + self.items.index(item)
+
+    def start_drag(self, event):
+        self.drag_from = self.position_at(event.y)
+
+    def finish_drag(self, event):
+        source, target = self.drag_from, self.position_at(event.y)
+        self.drag_from = None
+        if source is None or target is None or source == target:
+            return
+        if self.order is None:
+            self.order = list(range(len(self.rows)))
+        self.order.insert(target, self.order.pop(source))
+        self.positions = [0] * len(self.order)
+        for position, index in enumerate(self.order):
+            self.positions[index] = position
+        self.render()
+        if self.on_reorder:
+            self.on_reorder(self.order)
+
+    def visible_count(self):
+        # The heading takes roughly one row of height
+        return max(1, self.tree.winfo_height() // int(self.row_height) - 1)
+
+    def scroll(self, rows):
+        self.first = max(0, min(self.first + rows, len(self.rows) - self.visible_count()))
+        self.render()
+
+    def yview(self, action, value, unit=None):
+        if action == "moveto":
+            self.first = int(float(value) * len(self.rows))
+            self.scroll(0)
+        elif action == "scroll":
+            self.scroll(int(value) * (self.visible_count() if unit == "pages" else 1))
+
+    def render(self):
+        count = min(self.visible_count(), len(self.rows))
+        while len(self.items) < count:
+            self.items.append(self.tree.insert("", "end"))
+        while len(self.items) > count:
+            self.tree.delete(self.items.pop())
+        for offset, item in enumerate(self.items):
+            position = self.first + offset
+            self.tree.item(item, values=self.rows.row_values(self.order[position] if self.order else position))
+        total = len(self.rows)
+        if total:
+            self.scrollbar.set(self.first / total, (self.first + count) / total)
+        else:
+            self.scrollbar.set(0, 1)
+
+    def set_status(self, index, status):
+        self.rows.statuses[index] = status
+        position = self.positions[index] if self.positions else index
+        # Rows outside the window are picked up the next time they scroll into view
+        if self.first <= position < self.first + len(self.items):
+            self.tree.set(self.items[position - self.first], "Status", status)
 
 
 class VideoDownloaderApp:
@@ -38,27 +131,39 @@ class VideoDownloaderApp:
         self.root = root
         self.root.title("Video Downloader")
         self.root.geometry("1000x700")
-        self.download_tasks = []
-        self.max_concurrent_downloads = 10  # Updated to 10 simultaneous downloads
-        self.executor = ThreadPoolExecutor(max_workers=self.max_concurrent_downloads)
-        self.queue = queue.Queue()
+        # Start at 10 simultaneous downloads and let the engine adapt between the bounds
+        self.min_concurrent_downloads = 2
+        self.max_concurrent_downloads = 16
+        self.engine = DownloadEngine(
+            max_concurrent_downloads=self.max_concurrent_downloads,
+            min_concurrent_downloads=self.min_concurrent_downloads,
+            initial_concurrent_downloads=10,
+            listener=self
+        )
+        self.visible_slots = 0
+        self.ui_updates = UIUpdateStore()  # Written by worker threads, drained by update_gui on the Tk thread
+        self.slot_states = {}  # Last state applied to each slot's widgets
         self.download_path = ""
         self.csv_file = ""
         self.running = True
-        self.tree_items = {}  # Maps task index to Treeview item ID
-        self.active_slots = {}  # Maps slot to current task
+
+        # yt_dlp is imported in the background while the window is drawn and a CSV is picked
+        self.prewarm_thread = prewarm()
 
         # GUI Elements
         self.create_gui()
 
-        # Check for ffmpeg
-        if not shutil.which("ffmpeg"):
-            messagebox.showerror("Error", "ffmpeg is not installed or not found in PATH.\nPlease install ffmpeg.")
-            self.root.quit()
+        # Check for ffmpeg once the window is up; the prewarm thread has usually cached the answer by then
+        self.root.after_idle(self.check_ffmpeg)
 
         # Periodically update GUI
         self.update_gui()
 
+    def check_ffmpeg(self):
+        if not ffmpeg_available():
+            messagebox.showerror("Error", "ffmpeg is not installed or not found in PATH.\nPlease install ffmpeg.")
+            self.root.quit()
+
     def create_gui(self):
         # CSV and Directory Selection
         self.select_frame = ttk.Frame(self.root)
@@ -73,6 +178,12 @@ class VideoDownloaderApp:
         self.dir_label = ttk.Label(self.select_frame, text="No directory selected")
         self.dir_label.pack(side="left", padx=5)
 
+        # Profile for rows without a Profile column; smaller profiles skip the video/audio merge where possible
+        ttk.Label(self.select_frame, text="Profile:").pack(side="left", padx=(15, 2))
+        self.profile_box = ttk.Combobox(self.select_frame, values=PROFILE_CHOICES, width=10, state="readonly")
+        self.profile_box.set(PROFILE_CHOICES[0])
+        self.profile_box.pack(side="left", padx=5)
+
         # Download and Global Control Buttons
         self.control_frame = ttk.Frame(self.root)
         self.control_frame.pack(pady=5)
@@ -93,6 +204,30 @@ class VideoDownloaderApp:
                                             state="disabled")
         self.cancel_all_button.pack(side="left", padx=5)
 
+        self.concurrency_label = ttk.Label(self.control_frame)
+        self.concurrency_label.pack(side="left", padx=5)
+
+        # Global bandwidth budget, shared by all downloads; empty or 0 means unlimited
+        ttk.Label(self.control_frame, text="Limit (MB/s):").pack(side="left", padx=(15, 2))
+        self.bandwidth_entry = ttk.Entry(self.control_frame, width=6)
+        self.bandwidth_entry.pack(side="left")
+        self.bandwidth_entry.bind("<Return>", lambda e: self.apply_bandwidth_limit())
+        ttk.Button(self.control_frame, text="Set", command=self.apply_bandwidth_limit).pack(side="left", padx=5)
+
+        # Order of the download queue; can be changed while downloading
+        ttk.Label(self.control_frame, text="Order:").pack(side="left", padx=(15, 2))
+        self.order_box = ttk.Combobox(self.control_frame, values=SCHEDULING_CHOICES, width=8, state="readonly")
+        self.order_box.set(SCHEDULING_CHOICES[0])
+        self.order_box.bind("<<ComboboxSelected>>", lambda e: self.apply_scheduling_policy())
+        self.order_box.pack(side="left")
+
+        # Batch totals from the pre-flight extraction pass
+        self.summary_label = ttk.Label(self.root, text="")
+        self.summary_label.pack(padx=10, anchor="w")
+        # Queue depth of the download and post-processing stages, polled every frame
+        self.stage_label = ttk.Label(self.root, text="")
+        self.stage_label.pack(padx=10, anchor="w")
+
         # CSV Content Table (Scrollable)
         self.table_frame = ttk.Frame(self.root)
         self.table_frame.pack(pady=10, padx=10, fill="both", expand=True)
@@ -109,8 +244,7 @@ class VideoDownloaderApp:
         self.tree = ttk.Treeview(
             self.tree_container,
             columns=("Title", "Speaker", "Sermon Series", "Date", "Status"),
-            show="headings",
-            yscrollcommand=self.scrollbar.set
+            show="headings"
         )
         self.tree.heading("Title", text="Title")
         self.tree.heading("Speaker", text="Speaker")
@@ -124,25 +258,24 @@ class VideoDownloaderApp:
         self.tree.column("Status", width=150, anchor="center")
         self.tree.pack(fill="both", expand=True)
 
-        # Configure scrollbar
-        self.scrollbar.configure(command=self.tree.yview)
-
-        # Configure mouse wheel scrolling
-        self.tree.bind("<MouseWheel>", lambda e: self.tree.yview_scroll(int(-1 * (e.delta / 120)), "units"))
+        # Scrolling and mouse wheel are handled by the virtual table, which renders only the visible rows
+        self.table = VirtualTable(self.tree, self.scrollbar, on_reorder=self.apply_queue_order)
 
         # Download Task List (Non-scrollable)
         self.task_frame = ttk.Frame(self.root)
         self.task_frame.pack(pady=10, padx=10, fill="x")
 
+        self.slot_frames = []
         self.task_labels = []
         self.progress_bars = []
         self.status_labels = []
         self.control_buttons = []
 
-        # Create placeholders for up to 10 simultaneous downloads
+        # Create placeholders for the maximum number of simultaneous downloads; only the ones in use are shown
         for i in range(self.max_concurrent_downloads):
             frame = ttk.Frame(self.task_frame)
-            frame.pack(fill="x", pady=5)
+            frame.grid(row=i, column=0, sticky="ew", pady=5)
+            self.slot_frames.append(frame)
 
             label = ttk.Label(frame, text="No task", width=50)
             label.pack(side="left", padx=5)
@@ -163,6 +296,8 @@ class VideoDownloaderApp:
             cancel_btn.pack(side="left", padx=5)
             self.control_buttons.append((pause_btn, cancel_btn))
 
+        self.update_slot_visibility()
+
     def select_csv(self):
         self.csv_file = filedialog.askopenfilename(
             title="Select CSV File",
@@ -189,333 +324,204 @@ class VideoDownloaderApp:
             self.start_button.config(state="disabled")
 
     def load_csv_to_table(self):
-        # Clear existing items
-        for item in self.tree.get_children():
-            self.tree.delete(item)
-        self.tree_items.clear()
-
         try:
-            with open(self.csv_file, newline='', encoding='utf-8-sig') as file:
-                reader = csv.DictReader(file)
-                required_columns = ['Title - Verses', 'Date', 'Speaker', 'Sermon Series', 'Sermon URL']
-                missing_columns = [col for col in required_columns if col not in reader.fieldnames]
-                if missing_columns:
-                    messagebox.showerror("Error", f"CSV missing columns: {', '.join(missing_columns)}")
-                    return
-
-                for idx, row in enumerate(reader):
-                    date = row['Date']
-                    status = "Pending"
-                    item_id = self.tree.insert("", "end", values=(
-                        row['Title - Verses'],
-                        row['Speaker'],
-                        row['Sermon Series'],
-                        date,
-                        status
-                    ))
-                    self.tree_items[idx] = item_id
+            rows = RowStore.from_csv(self.csv_file)
+        except ValueError as e:
+            rows = RowStore()
+            messagebox.showerror("Error", str(e))
         except Exception as e:
+            rows = RowStore()
             messagebox.showerror("Error", f"Failed to load CSV: {e}")
+        self.table.set_rows(rows)
 
     def start_downloads(self):
+        self.engine.default_profile = self.profile_box.get()
+        self.start_button.config(state="disabled")
+        self.profile_box.config(state="disabled")
+        # Building tasks for a large CSV takes seconds, so it runs off the Tk thread; update_gui starts the batch
+        order = list(self.table.order) if self.table.order else None
+        threading.Thread(target=self.load_batch, args=(self.table.rows, self.download_path, order),
+                         daemon=True).start()
+
+    def load_batch(self, rows, download_path, order):
         try:
-            # Validate CSV and create tasks
-            with open(self.csv_file, newline='', encoding='utf-8-sig') as file:
-                reader = csv.DictReader(file)
-                self.download_tasks = []
-                for idx, row in enumerate(reader):
-                    try:
-                        year = datetime.datetime.strptime(row['Date'], '%Y-%m-%d').year
-                    except ValueError:
-                        year = ""
-                    task = DownloadTask(
-                        url=row['Sermon URL'],
-                        title=row['Title - Verses'],
-                        save_path=self.download_path,
-                        speaker=row['Speaker'],
-                        sermon_series=row['Sermon Series'],
-                        year=year,
-                        index=idx
-                    )
-                    self.download_tasks.append(task)
-
-                # Start processing tasks
-                self.start_button.config(state="disabled")
-                self.pause_all_button.config(state="normal")
-                self.resume_all_button.config(state="normal")
-                self.cancel_all_button.config(state="normal")
-                threading.Thread(target=self.process_tasks, daemon=True).start()
-
+            self.engine.load_tasks(rows, download_path)
+            if order:
+                self.engine.set_queue_order(order)
         except Exception as e:
-            messagebox.showerror("Error", f"Unexpected error: {e}")
-
-    def process_tasks(self):
-        task_index = 0
-
-        while task_index < len(self.download_tasks) and self.running:
-            # Find an available slot
-            available_slot = None
-            for slot in range(self.max_concurrent_downloads):
-                if slot not in self.active_slots or self.active_slots[slot].status in ["Completed", "Terminated",
-                                                                                       "Error"]:
-                    available_slot = slot
-                    break
-
-            if available_slot is not None and task_index < len(self.download_tasks):
-                task = self.download_tasks[task_index]
-                self.active_slots[available_slot] = task
-                self.update_task_gui(available_slot, task)
-                self.executor.submit(self.download_video, task, available_slot)
-                task_index += 1
-            else:
-                try:
-                    self.queue.get_nowait()
-                except queue.Empty:
-                    self.root.after(100, lambda: None)  # Yield control
-
-        # Wait for all tasks to complete
-        while any(slot in self.active_slots and self.active_slots[slot].status in ["Downloading", "Paused",
-                                                                                   "Adding Metadata"] for slot in
-                  range(self.max_concurrent_downloads)) and self.running:
-            try:
-                self.queue.get_nowait()
-            except queue.Empty:
-                self.root.after(100, lambda: None)  # Yield control
+            self.ui_updates.publish(("loaded",), f"Unexpected error: {e}")
+            return
+        self.ui_updates.publish(("loaded",), None)
+
+    def batch_loaded(self, error):
+        if error:
+            messagebox.showerror("Error", error)
+            self.start_button.config(state="normal")
+            self.profile_box.config(state="readonly")
+            return
+        self.pause_all_button.config(state="normal")
+        self.resume_all_button.config(state="normal")
+        self.cancel_all_button.config(state="normal")
+        self.engine.start()
+
+    def apply_scheduling_policy(self):
+        policy = self.order_box.get()
+        if policy == "manual":
+            self.engine.set_queue_order(self.table.order or range(len(self.table.rows)))
+            return
+        # Named policies sort the queue themselves; the table goes back to CSV order
+        self.table.reset_order()
+        self.engine.set_scheduling_policy(policy)
+
+    def apply_queue_order(self, order):
+        self.order_box.set("manual")
+        self.engine.set_queue_order(order)
+
+    def apply_bandwidth_limit(self):
+        value = self.bandwidth_entry.get().strip()
+        try:
+            rate = float(value) * 1024 * 1024 if value else 0
+        except ValueError:
+            messagebox.showerror("Error", f"Invalid bandwidth limit: {value}")
+            return
+        self.engine.set_bandwidth_limit(rate)
 
+    def finish_downloads(self):
         self.start_button.config(state="normal")
         self.pause_all_button.config(state="disabled")
         self.resume_all_button.config(state="disabled")
         self.cancel_all_button.config(state="disabled")
+        self.profile_box.config(state="readonly")
+
+    # Engine listener callbacks, invoked from scheduler and worker threads
+
+    def task_updated(self, slot, task):
+        self.publish_task(slot, task)
+
+    def status_changed(self, task):
+        self.publish_status(task)
+
+    def slot_cleared(self, slot):
+        self.clear_task_gui(slot)
+
+    def batch_finished(self):
+        self.ui_updates.publish(("batch",), "finished")
+
+    def concurrency_changed(self, limit):
+        self.ui_updates.publish(("limit",), limit)
+
+    def preflight_finished(self, total_bytes, total_duration, failed, bytes_saved):
+        summary = (f"Batch: {total_bytes / (1024 ** 3):.2f} GB to download, "
+                   f"{total_duration / 3600:.1f} hours of video")
+        if bytes_saved:
+            summary += f", {bytes_saved / (1024 ** 3):.2f} GB saved by the download profile"
+        if failed:
+            summary += f", {failed} URLs could not be checked in advance"
+        self.ui_updates.publish(("summary",), summary)
+
+    def duplicates_resolved(self, downloads_saved, bytes_saved):
+        self.ui_updates.publish(("duplicates",), f"{downloads_saved} duplicate rows linked or copied locally, "
+                                                 f"{bytes_saved / (1024 ** 3):.2f} GB not downloaded again")
+
+    def update_slot_visibility(self):
+        # Keep rows above a lowered limit visible until their download finishes
+        busy = [slot for slot, state in self.slot_states.items() if state[3] == "normal"]
+        visible = max([self.engine.concurrency_limit] + [slot + 1 for slot in busy])
+        if visible != self.visible_slots:
+            for slot, frame in enumerate(self.slot_frames):
+                if slot < visible:
+                    frame.grid()
+                else:
+                    frame.grid_remove()
+            self.visible_slots = visible
+        self.concurrency_label.config(
+            text=f"Concurrent downloads: {self.engine.concurrency_limit} "
+                 f"({self.min_concurrent_downloads}-{self.max_concurrent_downloads})"
+        )
 
-    def update_task_gui(self, slot, task):
-        self.task_labels[slot].config(text=f"{task.title} ({task.progress:.1f}%, ETA: {task.eta})")
-        self.status_labels[slot].config(text=task.status)
-        self.progress_bars[slot].config(value=task.progress)
-        pause_btn, cancel_btn = self.control_buttons[slot]
-        pause_btn.config(state="normal")
-        cancel_btn.config(state="normal")
-        if task.index in self.tree_items:
-            self.tree.set(self.tree_items[task.index], "Status", task.status)
+    def publish_task(self, slot, task):
+        self.ui_updates.publish(("slot", slot), (
+            f"{task.title} ({task.progress:.1f}%, ETA: {task.eta})",
+            task.status,
+            task.progress,
+            "normal",
+            "Resume" if task.paused else "Pause"
+        ))
+        self.publish_status(task)
+
+    def publish_status(self, task):
+        self.ui_updates.publish(("row", task.index), task.status)
 
     def clear_task_gui(self, slot):
-        self.task_labels[slot].config(text="No task")
-        self.status_labels[slot].config(text="Idle")
-        self.progress_bars[slot].config(value=0)
+        self.ui_updates.publish(("slot", slot), IDLE_SLOT_STATE)
+
+    def apply_slot_state(self, slot, state):
+        # Only touch the widgets whose value actually changed since the last frame
+        previous = self.slot_states.get(slot, IDLE_SLOT_STATE)
+        if state[3] != previous[3]:
+            self.slot_states[slot] = state
+            self.update_slot_visibility()
+        text, status, progress, control_state, pause_text = state
+        if text != previous[0]:
+            self.task_labels[slot].config(text=text)
+        if status != previous[1]:
+            self.status_labels[slot].config(text=status)
+        if progress != previous[2]:
+            self.progress_bars[slot].config(value=progress)
         pause_btn, cancel_btn = self.control_buttons[slot]
-        pause_btn.config(state="disabled")
-        cancel_btn.config(state="disabled")
-        if slot in self.active_slots:
-            del self.active_slots[slot]
+        if control_state != previous[3]:
+            pause_btn.config(state=control_state)
+            cancel_btn.config(state=control_state)
+        if pause_text != previous[4]:
+            pause_btn.config(text=pause_text)
+        self.slot_states[slot] = state
 
     def pause_all(self):
-        for slot in range(self.max_concurrent_downloads):
-            if slot in self.active_slots:
-                task = self.active_slots[slot]
-                if task.status == "Downloading":
-                    task.paused = True
-                    task.status = "Paused"
-                    task.process = None  # Signal to stop current download
-                    self.status_labels[slot].config(text=task.status)
-                    self.task_labels[slot].config(text=f"{task.title} ({task.progress:.1f}%, ETA: {task.eta})")
-                    self.control_buttons[slot][0].config(text="Resume")
-                    if task.index in self.tree_items:
-                        self.tree.set(self.tree_items[task.index], "Status", task.status)
+        self.engine.pause_all()
 
     def resume_all(self):
-        for slot in range(self.max_concurrent_downloads):
-            if slot in self.active_slots:
-                task = self.active_slots[slot]
-                if task.status == "Paused":
-                    task.paused = False
-                    task.status = "Downloading"
-                    self.status_labels[slot].config(text=task.status)
-                    self.task_labels[slot].config(text=f"{task.title} ({task.progress:.1f}%, ETA: {task.eta})")
-                    self.control_buttons[slot][0].config(text="Pause")
-                    if task.index in self.tree_items:
-                        self.tree.set(self.tree_items[task.index], "Status", task.status)
-                    self.executor.submit(self.download_video, task, slot)
+        self.engine.resume_all()
 
     def cancel_all(self):
-        for slot in range(self.max_concurrent_downloads):
-            if slot in self.active_slots:
-                task = self.active_slots[slot]
-                if task.status in ["Downloading", "Paused"]:
-                    task.terminated = True
-                    task.status = "Terminated"
-                    self.status_labels[slot].config(text=task.status)
-                    if task.index in self.tree_items:
-                        self.tree.set(self.tree_items[task.index], "Status", task.status)
-                    # Clean up partial file
-                    if task.partial_file and os.path.exists(task.partial_file):
-                        os.remove(task.partial_file)
-                    self.clear_task_gui(slot)
-                    self.queue.put("done")
+        self.engine.cancel_all()
 
     def toggle_pause(self, slot):
-        if slot in self.active_slots:
-            task = self.active_slots[slot]
-            if task.status in ["Downloading", "Paused"]:
-                task.paused = not task.paused
-                task.status = "Paused" if task.paused else "Downloading"
-                self.status_labels[slot].config(text=task.status)
-                self.task_labels[slot].config(text=f"{task.title} ({task.progress:.1f}%, ETA: {task.eta})")
-                self.control_buttons[slot][0].config(text="Resume" if task.paused else "Pause")
-                if task.index in self.tree_items:
-                    self.tree.set(self.tree_items[task.index], "Status", task.status)
-                if task.paused:
-                    task.process = None  # Signal to stop current download
-                else:
-                    # Resume by restarting download in a new thread
-                    self.executor.submit(self.download_video, task, slot)
+        self.engine.toggle_pause(slot)
 
     def terminate_download(self, slot):
-        if slot in self.active_slots:
-            task = self.active_slots[slot]
-            if task.status in ["Downloading", "Paused"]:
-                task.terminated = True
-                task.status = "Terminated"
-                self.status_labels[slot].config(text=task.status)
-                if task.index in self.tree_items:
-                    self.tree.set(self.tree_items[task.index], "Status", task.status)
-                # Clean up partial file
-                if task.partial_file and os.path.exists(task.partial_file):
-                    os.remove(task.partial_file)
-                self.clear_task_gui(slot)
-                self.queue.put("done")
-
-    def sanitize_filename(self, title):
-        invalid_chars = r'[<>:"/\\|?*]'
-        safe_title = re.sub(invalid_chars, '_', title)
-        safe_title = re.sub(r'_+', '_', safe_title)
-        return safe_title.strip('_ ').strip()
-
-    def download_video(self, task, slot):
-        try:
-            task.status = "Downloading"
-            self.status_labels[slot].config(text=task.status)
-            if task.index in self.tree_items:
-                self.tree.set(self.tree_items[task.index], "Status", task.status)
-            safe_title = self.sanitize_filename(task.title)
-            expected_file = os.path.join(task.save_path, f"{safe_title}.mp4")
-
-            if os.path.exists(expected_file):
-                task.status = "Completed (Exists)"
-                self.status_labels[slot].config(text=task.status)
-                if task.index in self.tree_items:
-                    self.tree.set(self.tree_items[task.index], "Status", task.status)
-                self.queue.put("done")
-                return
-
-            ydl_opts = {
-                'outtmpl': f'{task.save_path}/{safe_title}.%(ext)s',
-                'format': 'bestvideo+bestaudio/best',
-                'merge_output_format': 'mp4',
-                'progress_hooks': [lambda d: self.progress_hook(d, task, slot)],
-                'continuedl': True,  # Enable resuming partial downloads
-            }
-
-            while task.status == "Downloading" and not task.terminated:
-                try:
-                    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                        task.process = ydl
-                        info = ydl.extract_info(task.url, download=True)
-                        task.filename = ydl.prepare_filename(info)
-                        task.partial_file = None  # Clear partial file on completion
-                        if not task.terminated:
-                            task.status = "Adding Metadata"
-                            self.status_labels[slot].config(text=task.status)
-                            if task.index in self.tree_items:
-                                self.tree.set(self.tree_items[task.index], "Status", task.status)
-                            self.add_metadata(task.filename, task.title, task.speaker, task.sermon_series, task.year)
-                            task.status = "Completed"
-                            self.status_labels[slot].config(text=task.status)
-                            if task.index in self.tree_items:
-                                self.tree.set(self.tree_items[task.index], "Status", task.status)
-                        break
-                except yt_dlp.utils.DownloadError as e:
-                    if task.paused:
-                        task.partial_file = f"{task.save_path}/{safe_title}.mp4.part"  # Track partial file
-                        break
-                    elif task.terminated:
-                        break
-                    else:
-                        raise e
-
-        except Exception as e:
-            if not task.terminated:
-                task.status = f"Error: {str(e)}"
-                self.status_labels[slot].config(text=task.status)
-                if task.index in self.tree_items:
-                    self.tree.set(self.tree_items[task.index], "Status", task.status)
-        finally:
-            if not task.terminated and task.status not in ["Paused"]:
-                self.queue.put("done")
-            if task.status != "Paused":
-                self.clear_task_gui(slot)
-
-    def progress_hook(self, d, task, slot):
-        if task.terminated:
-            raise yt_dlp.utils.DownloadError("Download terminated by user")
-        if task.paused:
-            task.downloaded_bytes = d.get('downloaded_bytes', task.downloaded_bytes)
-            raise yt_dlp.utils.DownloadError("Download paused by user")
-        if d['status'] == 'downloading':
-            if 'downloaded_bytes' in d and 'total_bytes' in d:
-                task.downloaded_bytes = d['downloaded_bytes']
-                task.progress = (task.downloaded_bytes / d['total_bytes']) * 100
-                self.progress_bars[slot].config(value=task.progress)
-                task.eta = d.get('eta', 'N/A')
-                if isinstance(task.eta, (int, float)):
-                    task.eta = f"{int(task.eta)}s"
-                self.task_labels[slot].config(text=f"{task.title} ({task.progress:.1f}%, ETA: {task.eta})")
-        elif d['status'] == 'finished':
-            task.progress = 100
-            task.eta = "0s"
-            self.progress_bars[slot].config(value=task.progress)
-            self.task_labels[slot].config(text=f"{task.title} ({task.progress:.1f}%, ETA: {task.eta})")
-
-    def add_metadata(self, video_path, title, speaker, sermon_series, year):
-        try:
-            output_path = video_path.replace(".mp4", "_meta.mp4")
-            cmd = [
-                "ffmpeg", "-i", video_path, "-c", "copy",
-                "-metadata", f"title={title}",
-                "-metadata", f"artist={speaker}",
-                "-metadata", f"album={sermon_series}",
-                "-metadata", f"date={year}",
-                output_path
-            ]
-            subprocess.run(cmd, check=True, capture_output=True, text=True, timeout=300)
-            if not os.path.exists(output_path):
-                raise FileNotFoundError(f"Temporary file {output_path} was not created.")
-            os.remove(video_path)
-            os.rename(output_path, video_path)
-        except Exception as e:
-            print(f"Error updating metadata for {video_path}: {e}")
-            if os.path.exists(output_path):
-                os.remove(output_path)
+        self.engine.terminate_download(slot)
 
     def update_gui(self):
+        # Apply at most one coalesced update per slot and per table row each frame
+        for key, value in self.ui_updates.drain().items():
+            if key[0] == "slot":
+                self.apply_slot_state(key[1], value)
+            elif key[0] == "row":
+                self.table.set_status(key[1], value)
+            elif key[0] == "loaded":
+                self.batch_loaded(value)
+            elif key[0] == "batch":
+                self.finish_downloads()
+            elif key[0] == "limit":
+                self.update_slot_visibility()
+            elif key[0] == "summary":
+                self.summary_label.config(text=value)
+            elif key[0] == "duplicates":
+                summary = self.summary_label.cget("text")
+                self.summary_label.config(text=f"{summary}; {value}" if summary else value)
+        stages = (f"Download: {len(self.engine.active_slots)} active, {len(self.engine.pending_tasks)} queued, "
+                  f"{len(self.engine.retry_tasks)} waiting to retry | "
+                  f"Post-processing: {self.engine.postprocess_running} running, "
+                  f"{self.engine.postprocess_queued} queued | "
+                  f"UI updates: {self.ui_updates.published} published, {self.ui_updates.dropped} coalesced")
+        if stages != self.stage_label.cget("text"):
+            self.stage_label.config(text=stages)
         if self.running:
             self.root.after(100, self.update_gui)
 
     def on_closing(self):
         self.running = False
-        for task in self.download_tasks:
-            task.terminated = True
-        self.executor.shutdown(wait=True)
-        # Clean up temporary files
-        for temp_file in glob.glob(os.path.join(self.download_path, "*_meta.mp4")):
-            try:
-                os.remove(temp_file)
-            except Exception:
-                pass
-        for task in self.download_tasks:
-            if task.partial_file and os.path.exists(task.partial_file):
-                try:
-                    os.remove(task.partial_file)
-                except Exception:
-                    pass
+        self.engine.shutdown()
         self.root.destroy()
 
 
@@ -523,4 +529,4 @@ if __name__ == "__main__":
     root = tk.Tk()
     app = VideoDownloaderApp(root)
     root.protocol("WM_DELETE_WINDOW", app.on_closing)
-    root.mainloop()
\ No newline at end of file
+    root.mainloop()
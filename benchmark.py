@@ -0,0 +1,519 @@
+import argparse
+import csv
+import json
+import os
+import random
+import resource
+import shutil
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CHUNK_SIZE = 64 * 1024
+SEGMENT_SECONDS = 2
+
+
+def make_base_mp4():
+    # A one-second real MP4 so ffmpeg can remux and tag the synthetic assets; falls back to a bare ftyp box
+    if shutil.which("ffmpeg"):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "base.mp4")
+            subprocess.run(
+                ["ffmpeg", "-loglevel", "error", "-f", "lavfi", "-i", "color=size=64x64:rate=1",
+                 "-f", "lavfi", "-i", "anullsrc", "-t", "1", "-c:v", "libx264", "-c:a", "aac", "-y", path],
+                check=True, capture_output=True
+            )
+            with open(path, "rb") as file:
+                return file.read()
+    return struct.pack(">I4s4sI4s", 20, b"ftyp", b"isom", 0, b"isom")
+
+
+class SyntheticAsset:
+    # The base MP4 followed by a top-level 'free' box, so any size is still a valid file; bytes are generated on demand
+    def __init__(self, base, size):
+        padding = max(size - len(base), 8)
+        self.prefix = base + struct.pack(">I4s", padding, b"free")
+        self.size = len(self.prefix) + padding - 8
+
+    def read(self, start, end):
+        # Bytes [start, end) of the asset
+        head = self.prefix[start:end] if start < len(self.prefix) else b""
+        return head + bytes(max(0, end - max(start, len(self.prefix))))
+
+
+class MediaRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    # Paths:
+    #   /video/<bytes>/<name>.mp4          progressive MP4 of the given size
+    #   /dash/<bytes>/<name>.mpd           DASH manifest splitting that size into segments
+    #   /dash/<bytes>/<name>/init.mp4      DASH initialisation segment (the base MP4)
+    #   /dash/<bytes>/<name>/<n>.m4s       DASH media segment n (a 'free' box)
+    def do_HEAD(self):
+        self.handle_request(send_body=False)
+
+    def do_GET(self):
+        self.handle_request(send_body=True)
+
+    def log_message(self, format, *args):
+        pass
+
+    def handle_request(self, send_body):
+        options = self.server.options
+        if options.latency:
+            time.sleep(options.latency / 1000)
+        if options.fail_rate and self.server.random.random() < options.fail_rate:
+            self.send_error(503, "Injected failure")
+            return
+
+        parts = self.path.split("?")[0].strip("/").split("/")
+        try:
+            kind, size = parts[0], int(parts[1])
+        except (IndexError, ValueError):
+            self.send_error(404)
+            return
+
+        if kind == "video" and len(parts) == 3:
+            self.send_asset(SyntheticAsset(self.server.base_mp4, size), "video/mp4", send_body)
+        elif kind == "dash" and len(parts) == 3 and parts[2].endswith(".mpd"):
+            manifest = self.server.dash_manifest(size, parts[2][:-len(".mpd")]).encode("utf-8")
+            self.send_bytes(manifest, "application/dash+xml", send_body)
+        elif kind == "dash" and len(parts) == 4 and parts[3] == "init.mp4":
+            self.send_bytes(self.server.base_mp4, "video/mp4", send_body)
+        elif kind == "dash" and len(parts) == 4 and parts[3].endswith(".m4s"):
+            segment_size = self.server.segment_size(size)
+            self.send_asset(SyntheticAsset(b"", segment_size), "video/iso.segment", send_body)
+        else:
+            self.send_error(404)
+
+    def send_bytes(self, body, content_type, send_body):
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if send_body:
+            self.wfile.write(body)
+
+    def send_asset(self, asset, content_type, send_body):
+        start, end = 0, asset.size
+        range_header = self.headers.get("Range")
+        if range_header and range_header.startswith("bytes="):
+            first, _, last = range_header[6:].partition("-")
+            start = int(first or 0)
+            end = min(int(last) + 1, asset.size) if last else asset.size
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{end - 1}/{asset.size}")
+        else:
+            self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(end - start))
+        self.send_header("Accept-Ranges", "bytes")
+        self.end_headers()
+        if not send_body:
+            return
+
+        transfer = self.server.start_transfer(self.path, start)
+        options = self.server.options
+        drop_at = None
+        if options.drop_rate and self.server.random.random() < options.drop_rate:
+            drop_at = start + (end - start) // 2
+        position = start
+        while position < end:
+            chunk_end = min(position + CHUNK_SIZE, end)
+            if drop_at is not None and chunk_end > drop_at:
+                # Injected mid-transfer disconnect; the client has to resume with a Range request
+                self.close_connection = True
+                return
+            chunk_started = time.monotonic()
+            self.wfile.write(asset.read(position, chunk_end))
+            transfer[2] += chunk_end - position
+            if options.throttle:
+                delay = (chunk_end - position) / options.throttle - (time.monotonic() - chunk_started)
+                if delay > 0:
+                    time.sleep(delay)
+            position = chunk_end
+
+
+class MediaServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, options):
+        super().__init__(address, MediaRequestHandler)
+        self.options = options
+        self.random = random.Random(options.seed)
+        self.base_mp4 = make_base_mp4()
+        self.lock = threading.Lock()
+        self.transfers = []  # [path, first byte, bytes sent] of every asset response, for tests run in-process
+
+    def start_transfer(self, path, start):
+        transfer = [path, start, 0]
+        with self.lock:
+            self.transfers.append(transfer)
+        return transfer
+
+    def segment_count(self, size):
+        return max(1, size // self.options.segment_size)
+
+    def segment_size(self, size):
+        return max(size // self.segment_count(size), 8)
+
+    def dash_manifest(self, size, name):
+        count = self.segment_count(size)
+        duration = count * SEGMENT_SECONDS
+        # Segment URLs are relative to the manifest, so they carry the asset name as a directory
+        segments = "".join(f'<SegmentURL media="{name}/{index}.m4s"/>' for index in range(1, count + 1))
+        bandwidth = self.segment_size(size) * 8 // SEGMENT_SECONDS
+        return (
+            '<?xml version="1.0" encoding="UTF-8"?>'
+            '<MPD xmlns="urn:mpeg:dash:schema:mpd:2011" type="static" '
+            f'mediaPresentationDuration="PT{duration}S" minBufferTime="PT2S" '
+            'profiles="urn:mpeg:dash:profile:isoff-main:2011">'
+            '<Period><AdaptationSet mimeType="video/mp4" segmentAlignment="true">'
+            f'<Representation id="video" codecs="avc1.64000a" width="64" height="64" bandwidth="{bandwidth}">'
+            f'<SegmentList timescale="1" duration="{SEGMENT_SECONDS}">'
+            f'<Initialization sourceURL="{name}/init.mp4"/>'
+            f'{segments}</SegmentList></Representation></AdaptationSet></Period></MPD>'
+        )
+
+
+def serve(options):
+    server = MediaServer(("127.0.0.1", options.port), options)
+    # The parent reads the port from the first line
+    print(server.server_address[1], flush=True)
+    server.serve_forever()
+
+
+def workload_sizes(options):
+    rng = random.Random(options.seed)
+    mb = 1024 * 1024
+    if options.workload == "uniform":
+        return [int(options.size_mb * mb)] * options.tasks
+    if options.workload == "mixed":
+        return [int(rng.uniform(0.25, 1.75) * options.size_mb * mb) for _ in range(options.tasks)]
+    if options.workload == "longtail":
+        # Mostly short files plus two recordings ten times the size at the end of the CSV, so they finish last
+        sizes = [int(options.size_mb * mb / 4)] * max(options.tasks - 2, 0)
+        return sizes + [int(options.size_mb * 10 * mb)] * min(options.tasks, 2)
+    if options.workload == "skewed":
+        # Heavy-tailed sizes, most files small and a few up to ten times --size-mb, with the large
+        # ones late in the CSV the way long recordings tend to land at the end of an export
+        sizes = sorted(int(min(rng.paretovariate(1.5) / 3, 10) * options.size_mb * mb) for _ in range(options.tasks))
+        return sizes[::2] + sizes[1::2]
+    raise ValueError(f"Unknown workload: {options.workload}")
+
+
+def write_csv(path, base_url, sizes, options):
+    with open(path, "w", newline="", encoding="utf-8") as file:
+        writer = csv.writer(file)
+        writer.writerow(["Title - Verses", "Date", "Speaker", "Sermon Series", "Sermon URL"])
+        for index, size in enumerate(sizes):
+            if options.dash:
+                url = f"{base_url}/dash/{size}/asset{index}.mpd"
+            else:
+                url = f"{base_url}/video/{size}/asset{index}.mp4"
+            writer.writerow([f"Benchmark {index:04d}", "2024-01-07", "Bench Speaker", "Bench Series", url])
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def bytes_written():
+    # wchar counts write() calls, so page-cache writes on tmpfs too; reaped children such as ffmpeg are included
+    try:
+        with open("/proc/self/io", encoding="ascii") as file:
+            fields = dict(line.split(": ") for line in file.read().splitlines())
+        return int(fields["wchar"])
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+def run_batch(options, csv_path, output_dir):
+    # Imported here so `benchmark.py serve` starts without loading yt-dlp
+    from download_engine import DownloadEngine, EngineListener, RetryPolicy, RowStore, FINISHED_STATUSES
+
+    class TimingListener(EngineListener):
+        def __init__(self):
+            self.started = {}
+            self.finished = {}
+
+        def task_updated(self, slot, task):
+            now = time.monotonic()
+            if task.status == "Downloading":
+                self.started.setdefault(task.index, now)
+            elif task.status in FINISHED_STATUSES or task.status.startswith("Error"):
+                self.finished.setdefault(task.index, now)
+
+        def status_changed(self, task):
+            # Post-processing reports completions here rather than through a slot
+            self.task_updated(None, task)
+
+    listener = TimingListener()
+    engine = DownloadEngine(
+        max_concurrent_downloads=options.concurrency,
+        listener=listener,
+        quiet=True,
+        bandwidth_limit=options.limit_rate,
+        connection_budget=options.connections,
+        scheduling_policy=options.order,
+        retry_policy=RetryPolicy(base_delay=options.retry_delay)
+    )
+    engine.load_tasks(RowStore.from_csv(csv_path), output_dir)
+
+    usage_before = resource.getrusage(resource.RUSAGE_SELF)
+    children_before = resource.getrusage(resource.RUSAGE_CHILDREN)
+    written_before = bytes_written()
+    started = time.monotonic()
+    engine.process_tasks()
+    wall = time.monotonic() - started
+    usage_after = resource.getrusage(resource.RUSAGE_SELF)
+    children_after = resource.getrusage(resource.RUSAGE_CHILDREN)
+    written = bytes_written() - written_before if written_before is not None else None
+    tasks = engine.download_tasks
+    engine.shutdown()
+
+    latencies = [listener.finished[index] - listener.started[index]
+                 for index in listener.finished if index in listener.started]
+    cpu = (usage_after.ru_utime - usage_before.ru_utime) + (usage_after.ru_stime - usage_before.ru_stime)
+    child_cpu = ((children_after.ru_utime - children_before.ru_utime)
+                 + (children_after.ru_stime - children_before.ru_stime))
+    completed = sum(1 for task in tasks if task.status in FINISHED_STATUSES)
+    return {
+        "tasks": len(tasks),
+        "completed": completed,
+        "errors": sum(1 for task in tasks if task.status.startswith("Error")),
+        "wall_seconds": round(wall, 3),
+        "bytes_downloaded": engine.bytes_downloaded,
+        "mb_per_second": round(engine.bytes_downloaded / (1024 * 1024) / wall, 3) if wall else None,
+        # Disk writes by the engine and its ffmpeg runs; a ratio of 2 means every byte is written twice
+        "bytes_written": written,
+        "bytes_written_per_task": round(written / completed) if written is not None and completed else None,
+        "write_amplification": (round(written / engine.bytes_downloaded, 3)
+                                if written is not None and engine.bytes_downloaded else None),
+        "task_latency_p50": round(percentile(latencies, 0.5), 3) if latencies else None,
+        "task_latency_p95": round(percentile(latencies, 0.95), 3) if latencies else None,
+        "cpu_seconds": round(cpu, 3),
+        "child_cpu_seconds": round(child_cpu, 3),
+        # ru_maxrss is in kilobytes on Linux
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+
+def start_server(options):
+    # A separate process, so the server's own CPU time does not count against the engine
+    command = [sys.executable, os.path.abspath(__file__), "serve", "--port", "0", "--seed", str(options.seed),
+               "--segment-size", str(options.segment_size), "--latency", str(options.latency),
+               "--throttle", str(options.throttle), "--fail-rate", str(options.fail_rate),
+               "--drop-rate", str(options.drop_rate)]
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, text=True)
+    port = int(process.stdout.readline())
+    return process, f"http://127.0.0.1:{port}"
+
+
+def parse_importtime(stderr):
+    # "-X importtime" lines: "import time: self [us] | cumulative | <indent>package"; indent shows nesting depth
+    entries = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        fields = line[len("import time:"):].split("|")
+        self_us, cumulative_us, name = int(fields[0]), int(fields[1]), fields[2].rstrip()
+        depth = (len(name) - len(name.lstrip())) // 2
+        entries.append((cumulative_us, self_us, depth, name.strip()))
+    return entries
+
+
+def startup(options):
+    # Each module is imported in a fresh interpreter, the way the GUI and the CLI start
+    here = os.path.dirname(os.path.abspath(__file__))
+    results = {}
+    for module in options.modules:
+        samples = []
+        for _ in range(options.repeat):
+            started = time.perf_counter()
+            process = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                                     capture_output=True, text=True, cwd=here)
+            samples.append(time.perf_counter() - started)
+        if process.returncode != 0:
+            print(f"{module}: import failed\n{process.stderr.strip().splitlines()[-1]}", file=sys.stderr)
+            continue
+        entries = parse_importtime(process.stderr)
+        own = [entry for entry in entries if entry[3] == module]
+        results[f"{module}_process_seconds"] = round(sorted(samples)[len(samples) // 2], 4)
+        results[f"{module}_import_ms"] = round(own[-1][0] / 1000, 1) if own else None
+        print(f"{module}: {results[f'{module}_process_seconds']}s interpreter + import (median of {options.repeat})")
+        for cumulative_us, self_us, depth, name in sorted(entries, reverse=True)[:options.top]:
+            print(f"  {cumulative_us / 1000:9.1f} ms cumulative {self_us / 1000:8.1f} ms self  {'  ' * depth}{name}")
+
+    # How long the background prewarm takes until downloads can start without waiting on yt_dlp
+    process = subprocess.run(
+        [sys.executable, "-c", "import time; started = time.perf_counter(); import download_engine; "
+                               "download_engine.prewarm().join(); print(time.perf_counter() - started)"],
+        capture_output=True, text=True, cwd=here
+    )
+    if process.returncode == 0:
+        results["prewarm_seconds"] = round(float(process.stdout.strip()), 4)
+        print(f"prewarm: yt_dlp and ffmpeg probe ready after {results['prewarm_seconds']}s")
+    return results
+
+
+def measure_rows(count):
+    # Runs in a child process so every row count starts from a fresh heap and its own peak RSS
+    from download_engine import DownloadEngine, RowStore
+
+    with tempfile.TemporaryDirectory() as directory:
+        csv_path = os.path.join(directory, "rows.csv")
+        with open(csv_path, "w", newline="", encoding="utf-8") as file:
+            writer = csv.writer(file)
+            writer.writerow(["Title - Verses", "Date", "Speaker", "Sermon Series", "Sermon URL"])
+            for index in range(count):
+                writer.writerow([f"Sermon {index} - John {index % 21 + 1}:{index % 40 + 1}",
+                                 f"20{index % 20 + 5:02d}-{index % 12 + 1:02d}-{index % 28 + 1:02d}",
+                                 f"Speaker {index % 15}", f"Series {index % 60}",
+                                 f"https://www.youtube.com/watch?v={index:011d}"])
+        output_dir = os.path.join(directory, "downloads")
+        os.mkdir(output_dir)
+        engine = DownloadEngine(quiet=True)
+        # ru_maxrss is in kilobytes on Linux
+        rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        started = time.perf_counter()
+        rows = RowStore.from_csv(csv_path)
+        parsed = time.perf_counter()
+        engine.load_tasks(rows, output_dir)
+        loaded = time.perf_counter()
+        rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        engine.shutdown()
+    return {
+        "parse_seconds": round(parsed - started, 3),
+        "load_tasks_seconds": round(loaded - parsed, 3),
+        "peak_rss_mb": round(rss_after / 1024, 1),
+        "rss_growth_mb": round((rss_after - rss_before) / 1024, 1),
+    }
+
+
+def rows(options):
+    results = {}
+    for count in options.counts:
+        process = subprocess.run([sys.executable, os.path.abspath(__file__), "rows", "--measure", str(count)],
+                                 capture_output=True, text=True)
+        if process.returncode != 0:
+            print(f"{count} rows: failed\n{process.stderr.strip()}", file=sys.stderr)
+            continue
+        measured = json.loads(process.stdout.splitlines()[-1])
+        print(f"{count:>9} rows: {measured['parse_seconds']:7.3f}s parse, {measured['load_tasks_seconds']:7.3f}s "
+              f"load_tasks, {measured['peak_rss_mb']:8.1f} MB peak RSS (+{measured['rss_growth_mb']} MB)")
+        for key, value in measured.items():
+            results[f"rows_{count}_{key}"] = value
+    return results
+
+
+def compare(results, baseline_path):
+    with open(baseline_path, encoding="utf-8") as file:
+        baseline = json.load(file)["results"]
+    for key, value in results.items():
+        before = baseline.get(key)
+        if isinstance(value, (int, float)) and isinstance(before, (int, float)) and before:
+            print(f"{key:>20}: {before} -> {value} ({(value - before) / before * 100:+.1f}%)")
+
+
+def add_server_arguments(parser):
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--segment-size", type=int, default=1024 * 1024, help="DASH segment size in bytes")
+    parser.add_argument("--latency", type=float, default=0, help="Delay before every response, in ms")
+    parser.add_argument("--throttle", type=float, default=0, help="Per-connection rate cap in bytes/s")
+    parser.add_argument("--fail-rate", type=float, default=0, help="Fraction of requests answered with 503")
+    parser.add_argument("--drop-rate", type=float, default=0,
+                        help="Fraction of transfers cut off half way through")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Throughput benchmark against a local media server stand-in.")
+    subparsers = parser.add_subparsers(dest="command")
+
+    serve_parser = subparsers.add_parser("serve", help="Only run the media server")
+    serve_parser.add_argument("--port", type=int, default=8000)
+    add_server_arguments(serve_parser)
+
+    run_parser = subparsers.add_parser("run", help="Run a benchmark batch (default)")
+    add_server_arguments(run_parser)
+    run_parser.add_argument("--workload", default="uniform", choices=["uniform", "mixed", "longtail", "skewed"])
+    run_parser.add_argument("--order", default="csv", choices=["csv", "longest", "newest", "priority"],
+                            help="Engine scheduling policy")
+    run_parser.add_argument("--tasks", type=int, default=20)
+    run_parser.add_argument("--size-mb", type=float, default=20)
+    run_parser.add_argument("--dash", action="store_true", help="Serve DASH manifests instead of progressive MP4")
+    run_parser.add_argument("-j", "--concurrency", type=int, default=10)
+    run_parser.add_argument("--connections", type=int,
+                            help="Fragment connection budget shared by all downloads (default: twice -j)")
+    run_parser.add_argument("--limit-rate", type=float, help="Engine bandwidth budget in bytes/s")
+    run_parser.add_argument("--retry-delay", type=float, default=0.5,
+                            help="Engine backoff before the first retry, in seconds")
+    run_parser.add_argument("--json", help="Write the results to this file")
+    run_parser.add_argument("--baseline", help="Print the change against an earlier --json file")
+
+    startup_parser = subparsers.add_parser("startup", help="Break down import time with -X importtime")
+    startup_parser.add_argument("--modules", nargs="+",
+                                default=["download_engine", "download_cli", "YouTubeVideoDownloader"])
+    startup_parser.add_argument("--repeat", type=int, default=5)
+    startup_parser.add_argument("--top", type=int, default=15, help="Slowest imports to list per module")
+    startup_parser.add_argument("--json", help="Write the results to this file")
+    startup_parser.add_argument("--baseline", help="Print the change against an earlier --json file")
+
+    rows_parser = subparsers.add_parser("rows", help="Time CSV parsing and load_tasks and report peak RSS")
+    rows_parser.add_argument("--counts", type=int, nargs="+", default=[10000, 100000, 1000000])
+    rows_parser.add_argument("--measure", type=int, help=argparse.SUPPRESS)
+    rows_parser.add_argument("--json", help="Write the results to this file")
+    rows_parser.add_argument("--baseline", help="Print the change against an earlier --json file")
+
+    args = parser.parse_args(argv if argv is not None else (sys.argv[1:] or ["run"]))
+    if args.command == "serve":
+        serve(args)
+        return 0
+    if args.command == "rows" and args.measure:
+        print(json.dumps(measure_rows(args.measure)))
+        return 0
+    if args.command in ("startup", "rows"):
+        results = startup(args) if args.command == "startup" else rows(args)
+        if args.json:
+            with open(args.json, "w", encoding="utf-8") as file:
+                json.dump({"results": results, "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S")}, file, indent=2)
+        if args.baseline:
+            compare(results, args.baseline)
+        return 0
+
+    sizes = workload_sizes(args)
+    server, base_url = start_server(args)
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            output_dir = os.path.join(directory, "downloads")
+            os.mkdir(output_dir)
+            csv_path = os.path.join(directory, "batch.csv")
+            write_csv(csv_path, base_url, sizes, args)
+            results = run_batch(args, csv_path, output_dir)
+    finally:
+        server.terminate()
+        server.wait()
+
+    report = {
+        "config": {key: value for key, value in vars(args).items() if key not in ("json", "baseline", "command")},
+        "results": results,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+    print(json.dumps(report, indent=2))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as file:
+            json.dump(report, file, indent=2)
+    if args.baseline:
+        compare(results, args.baseline)
+    return 1 if results["errors"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,172 @@
+import argparse
+import datetime
+import os
+import sys
+import threading
+import time
+
+from download_engine import (
+    DownloadEngine, EngineListener, Metrics, RetryPolicy, RowStore, FINISHED_STATUSES, ffmpeg_available, prewarm
+)
+
+
+class ConsoleListener(EngineListener):
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.printed_statuses = {}  # Task index -> last status printed
+
+    def status_changed(self, task):
+        with self.lock:
+            print(f"[{task.index + 1}] {task.status}: {task.title}", flush=True)
+
+    def task_updated(self, slot, task):
+        # Progress ticks are summarised by report_progress; only print state transitions
+        if self.printed_statuses.get(task.index) != task.status:
+            self.printed_statuses[task.index] = task.status
+            self.status_changed(task)
+
+    def preflight_finished(self, total_bytes, total_duration, failed, bytes_saved):
+        with self.lock:
+            print(f"Pre-flight: {format_bytes(total_bytes)} to download "
+                  f"({format_bytes(bytes_saved)} saved by the profile), "
+                  f"{datetime.timedelta(seconds=int(total_duration))} of video, {failed} URLs failed extraction",
+                  flush=True)
+
+    def duplicates_resolved(self, downloads_saved, bytes_saved):
+        with self.lock:
+            print(f"Duplicates: {downloads_saved} downloads saved by linking or copying, "
+                  f"{format_bytes(bytes_saved)} not fetched again", flush=True)
+
+
+def format_bytes(count):
+    for unit in ["B", "KB", "MB", "GB"]:
+        if count < 1024:
+            return f"{count:.1f} {unit}"
+        count /= 1024
+    return f"{count:.1f} TB"
+
+
+def parse_rate(value):
+    # Accepts plain bytes per second or a K/M/G suffix, e.g. 500K or 4M
+    multipliers = {"K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}
+    value = value.strip().upper()
+    if value and value[-1] in multipliers:
+        return float(value[:-1]) * multipliers[value[-1]]
+    return float(value)
+
+
+def report_progress(engine, started, previous_bytes, interval):
+    total = len(engine.download_tasks)
+    done = sum(1 for task in engine.download_tasks if task.status in FINISHED_STATUSES)
+    failed = sum(1 for task in engine.download_tasks if task.status.startswith("Error"))
+    elapsed = time.monotonic() - started
+    received = engine.bytes_downloaded
+    rate = (received - previous_bytes) / interval if interval else 0
+    average = received / elapsed if elapsed else 0
+    print(
+        f"-- {time.strftime('%H:%M:%S')} | {done}/{total} done, {failed} failed, "
+        f"{len(engine.active_slots)}/{engine.concurrency_limit} active, {len(engine.pending_tasks)} queued, "
+        f"{engine.postprocess_running + engine.postprocess_queued} post-processing | "
+        f"{format_bytes(rate)}/s now, {format_bytes(average)}/s avg, {format_bytes(received)} total",
+        flush=True
+    )
+    return received
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Download the sermons listed in a CSV without the GUI.")
+    parser.add_argument("csv_file", help="CSV with Title - Verses, Date, Speaker, Sermon Series and Sermon URL columns")
+    parser.add_argument("output_dir", help="Directory the videos are saved to")
+    parser.add_argument("-j", "--concurrency", type=int, default=10,
+                        help="Simultaneous downloads, or the starting point when adapting (default: 10)")
+    parser.add_argument("--min-concurrency", type=int, default=1,
+                        help="Lower bound for adaptive concurrency (default: 1)")
+    parser.add_argument("--max-concurrency", type=int,
+                        help="Adapt the number of downloads to throughput and errors, up to this many")
+    parser.add_argument("--limit-rate", type=parse_rate,
+                        help="Total bandwidth shared by all downloads, in bytes/s (e.g. 500K, 4M)")
+    parser.add_argument("--connections", type=int,
+                        help="DASH/HLS fragment connections shared by all downloads (default: twice the concurrency)")
+    parser.add_argument("--postprocess-workers", type=int, default=2,
+                        help="Files tagged by ffmpeg at the same time, independent of the downloads (default: 2)")
+    parser.add_argument("--retries", type=int, default=4,
+                        help="Times a failed download is re-queued before it is reported as an error (default: 4)")
+    parser.add_argument("--retry-delay", type=float, default=5.0,
+                        help="Backoff before the first retry in seconds; doubles on every attempt (default: 5)")
+    parser.add_argument("--profile", default="original",
+                        help="original, audio or video-<height> (e.g. video-480) for rows without a Profile column "
+                             "(default: original)")
+    parser.add_argument("--event-log", help="Append per-task phase timings and events to this JSON-lines file")
+    parser.add_argument("--metrics-file",
+                        help="Keep Prometheus text-format metrics in this file "
+                             "(e.g. for node_exporter's textfile collector)")
+    parser.add_argument("--profile-batch", metavar="PREFIX",
+                        help="Profile the batch; writes PREFIX.prof (cProfile) and PREFIX.tracemalloc.txt")
+    parser.add_argument("--order", default="csv", choices=["csv", "longest", "newest", "priority"],
+                        help="Download queue order: CSV order, largest/longest first, newest date first or the "
+                             "Priority column (default: csv)")
+    parser.add_argument("--verify-existing", action="store_true",
+                        help="Hash and probe files from earlier runs that the integrity manifest doesn't cover yet, "
+                             "re-downloading corrupt ones")
+    parser.add_argument("--interval", type=float, default=5.0,
+                        help="Seconds between progress lines (default: 5)")
+    args = parser.parse_args(argv)
+    prewarm()  # Loads yt_dlp while the CSV is read and the journal opened
+
+    if not ffmpeg_available():
+        print("Error: ffmpeg is not installed or not found in PATH.", file=sys.stderr)
+        return 1
+    if not os.path.isdir(args.output_dir):
+        print(f"Error: {args.output_dir} is not a directory.", file=sys.stderr)
+        return 1
+
+    engine_options = dict(
+        listener=ConsoleListener(),
+        quiet=True,
+        bandwidth_limit=args.limit_rate,
+        profile=args.profile,
+        connection_budget=args.connections,
+        postprocess_workers=args.postprocess_workers,
+        metrics=Metrics(event_log=args.event_log, prometheus_file=args.metrics_file),
+        profile_prefix=args.profile_batch,
+        scheduling_policy=args.order,
+        verify_existing=args.verify_existing,
+        retry_policy=RetryPolicy(max_attempts=args.retries + 1, base_delay=args.retry_delay)
+    )
+    if args.max_concurrency:
+        engine = DownloadEngine(
+            max_concurrent_downloads=args.max_concurrency,
+            min_concurrent_downloads=args.min_concurrency,
+            initial_concurrent_downloads=args.concurrency,
+            **engine_options
+        )
+    else:
+        engine = DownloadEngine(max_concurrent_downloads=args.concurrency, **engine_options)
+    try:
+        engine.load_tasks(RowStore.from_csv(args.csv_file), args.output_dir)
+    except Exception as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+
+    started = time.monotonic()
+    worker = threading.Thread(target=engine.process_tasks, daemon=True)
+    worker.start()
+    previous_bytes = 0
+    previous_report = started
+    try:
+        while worker.is_alive():
+            worker.join(args.interval)
+            now = time.monotonic()
+            previous_bytes = report_progress(engine, started, previous_bytes, now - previous_report)
+            previous_report = now
+    except KeyboardInterrupt:
+        print("Interrupted; partial downloads are kept for the next run.", file=sys.stderr)
+    finally:
+        engine.shutdown()
+
+    failed = [task for task in engine.download_tasks if task.status.startswith("Error")]
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
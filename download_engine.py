@@ -0,0 +1,1769 @@
+import csv
+import os
+import subprocess
+import datetime
+import gc
+import re
+import shutil
+import threading
+import collections
+import sqlite3
+import time
+import json
+import zlib
+import sys
+import heapq
+import itertools
+import random
+import urllib.parse
+import contextlib
+import hashlib
+import importlib
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+JOURNAL_FILENAME = ".download_journal.sqlite3"
+MANIFEST_FILENAME = ".integrity_manifest.sqlite3"
+INFO_CACHE_FILENAME = ".info_cache.sqlite3"
+REQUIRED_COLUMNS = ['Title - Verses', 'Date', 'Speaker', 'Sermon Series', 'Sermon URL']
+OPTIONAL_COLUMNS = ['Priority', 'Profile']
+# How far into the pending queue the scheduler looks for a task whose host is not blocked by its circuit breaker
+DISPATCH_LOOKAHEAD = 256
+# Errors that will not go away by retrying
+PERMANENT_ERROR_MARKERS = [
+    "video unavailable", "private video", "unsupported url", "has been removed", "not available",
+    "copyright", "http error 404", "members-only", "sign in to confirm your age"
+]
+# Columns with few distinct values; interning them stores each value once however many rows repeat it
+INTERNED_COLUMNS = ['Date', 'Speaker', 'Sermon Series', 'Priority', 'Profile']
+# Download profiles; each prefers a single pre-muxed file so no ffmpeg merge is needed when the site offers one.
+# 'video-<height>' caps the resolution, e.g. video-480.
+DOWNLOAD_PROFILES = {
+    'original': {'format': 'bestvideo+bestaudio/best', 'merge_output_format': 'mp4'},
+    'audio': {'format': 'bestaudio[ext=m4a]/bestaudio[acodec=opus]/bestaudio/best'},
+}
+AUDIO_EXTENSIONS = ['m4a', 'webm', 'opus', 'mp3', 'ogg']
+# Protocols yt-dlp downloads as fragments, the only ones that use concurrent_fragment_downloads
+FRAGMENTED_PROTOCOLS = ['m3u8', 'm3u8_native', 'http_dash_segments', 'http_dash_segments_generator']
+FINISHED_STATUSES = ["Completed", "Completed (Exists)", "Completed (Journal)", "Completed (Linked)",
+                     "Completed (Copied)", "Terminated"]
+YOUTUBE_HOSTS = ["youtube.com", "m.youtube.com", "music.youtube.com", "youtube-nocookie.com"]
+# YouTube query parameters that select a start time, playlist position or referrer rather than a different video.
+# Other sites use the same names for the video itself (player.php?index=4), so they are only ignored on YouTube.
+IGNORED_QUERY_PARAMETERS = ["t", "start", "list", "index", "si", "feature", "pp", "ab_channel"]
+# The usual watch?v=, youtu.be and /shorts/-style links, matched without parsing the whole URL
+YOUTUBE_VIDEO_URL = re.compile(
+    r'\s*(?:https?://)?(?:www\.|m\.|music\.)?(?:youtube\.com/(?:watch\?(?:[^#]*&)?v=|(?:shorts|embed|live|v)/)|'
+    r'youtube-nocookie\.com/embed/|youtu\.be/)([\w-]+)'
+)
+
+
+class LazyModule:
+    # Imports the module on first attribute access; yt_dlp loads hundreds of extractors, so importing it
+    # would delay the window. prewarm() does the import on a background thread instead.
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+        self._lock = threading.Lock()
+
+    def load(self):
+        if self._module is None:
+            with self._lock:
+                if self._module is None:
+                    self._module = importlib.import_module(self._name)
+        return self._module
+
+    def __getattr__(self, attr):
+        return getattr(self.load(), attr)
+
+
+yt_dlp = LazyModule("yt_dlp")
+
+
+def prewarm():
+    # Import yt_dlp, build one YoutubeDL so its extractor list is cached, and probe for ffmpeg, off the UI thread
+    def warm():
+        yt_dlp.YoutubeDL({'quiet': True}).close()
+        ffmpeg_available()
+    thread = threading.Thread(target=warm, name="prewarm", daemon=True)
+    thread.start()
+    return thread
+
+
+class DownloadTask:
+    # Slots keep per-task overhead small for CSVs with hundreds of thousands of rows
+    __slots__ = (
+        'url', 'title', 'save_path', 'speaker', 'sermon_series', 'year', 'index', 'priority', 'process', 'paused',
+        'terminated', 'progress', 'eta', 'status', 'filename', 'partial_file', 'downloaded_bytes', 'total_bytes',
+        'expected_bytes', 'duration', 'resume_event', 'attempts', 'profile', 'original_bytes', 'output_name',
+        'current_format', 'date_ordinal', 'rank', 'fragmented', '__weakref__'
+    )
+
+    def __init__(self, url, title, save_path, speaker, sermon_series, year, index, priority=1.0, profile='original',
+                 date_ordinal=0):
+        self.url = url
+        self.title = title
+        self.save_path = save_path
+        self.speaker = speaker
+        self.sermon_series = sermon_series
+        self.year = year
+        self.index = index
+        self.rank = index  # Position in a manually ordered queue
+        self.date_ordinal = date_ordinal  # Sermon date as a proleptic ordinal, 0 when the date is missing
+        self.priority = priority  # Relative share of the bandwidth budget and, with the priority policy, of the queue
+        self.profile = profile
+        self.process = None
+        self.paused = False
+        self.resume_event = None  # Created on dispatch; cleared while paused, the worker blocks on it
+        self.terminated = False
+        self.progress = 0
+        self.eta = "N/A"
+        self.status = "Pending"
+        self.filename = None
+        self.partial_file = None  # Track partial download file
+        self.downloaded_bytes = 0  # Track downloaded bytes for resuming
+        self.total_bytes = 0
+        self.expected_bytes = None  # Size of the selected formats, known after pre-flight extraction
+        self.original_bytes = None  # What the 'original' profile would have downloaded instead
+        self.output_name = None  # Sanitized file name without extension, unique within the batch
+        self.current_format = None  # Format ID being transferred, to tell a new stream from reordered fragments
+        self.fragmented = None  # Whether a selected format is DASH/HLS, known after pre-flight extraction
+        self.attempts = 0  # Failed download attempts so far
+        self.duration = None
+
+
+# Sort keys for the download queue; the smallest key is dispatched first
+SCHEDULING_POLICIES = {
+    'csv': lambda task: (task.index,),
+    # Largest first (longest-processing-time rule) so a few long recordings don't form the tail of the batch
+    'longest': lambda task: (-(task.expected_bytes or 0), -(task.duration or 0), task.index),
+    'newest': lambda task: (-task.date_ordinal, task.index),
+    'priority': lambda task: (-task.priority, task.index),
+    # Order set by dragging rows in the GUI
+    'manual': lambda task: (task.rank, task.index),
+}
+
+
+class TaskQueue:
+    # Pending tasks ordered by a scheduling policy; retried tasks go ahead of everything else
+    def __init__(self, policy='csv'):
+        self.front = collections.deque()
+        self.heap = []  # (policy key, task index, task)
+        self.set_policy(policy)
+
+    def set_policy(self, policy):
+        if policy not in SCHEDULING_POLICIES:
+            raise ValueError(f"Unknown scheduling policy: {policy}")
+        self.policy = policy
+        self.key = SCHEDULING_POLICIES[policy]
+        self.rekey()
+
+    def rekey(self):
+        # Keys may read pre-flight results or manual ranks, so they are recomputed whenever those change
+        self.heap = [(self.key(task), task.index, task) for _, _, task in self.heap]
+        heapq.heapify(self.heap)
+
+    def __len__(self):
+        return len(self.front) + len(self.heap)
+
+    def __iter__(self):
+        yield from self.front
+        for _, _, task in sorted(self.heap):
+            yield task
+
+    def append(self, task):
+        heapq.heappush(self.heap, (self.key(task), task.index, task))
+
+    def appendleft(self, task):
+        self.front.appendleft(task)
+
+    def pop(self, dispatchable, lookahead):
+        # First task in queue order that dispatchable accepts, looking at most lookahead tasks deep
+        for position, task in enumerate(itertools.islice(self.front, lookahead)):
+            if dispatchable(task):
+                del self.front[position]
+                return task
+        skipped = []
+        try:
+            while self.heap and len(skipped) + min(len(self.front), lookahead) < lookahead:
+                entry = heapq.heappop(self.heap)
+                if dispatchable(entry[2]):
+                    return entry[2]
+                skipped.append(entry)
+        finally:
+            for entry in skipped:
+                heapq.heappush(self.heap, entry)
+        return None
+
+
+class DownloadJournal:
+    FLUSH_INTERVAL = 2.0  # Seconds between batched commits of progress updates
+
+    def __init__(self, directory):
+        self.path = os.path.join(directory, JOURNAL_FILENAME)
+        self.lock = threading.Lock()
+        self.pending = {}  # (url, title) -> row not yet committed
+        self.last_flush = time.monotonic()
+        self.connection = sqlite3.connect(self.path, check_same_thread=False)
+        # WAL keeps committed rows intact if the app or machine dies mid-write
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS downloads ("
+            " url TEXT NOT NULL,"
+            " title TEXT NOT NULL,"
+            " filename TEXT,"
+            " status TEXT,"
+            " downloaded_bytes INTEGER DEFAULT 0,"
+            " total_bytes INTEGER DEFAULT 0,"
+            " completed INTEGER DEFAULT 0,"
+            " updated REAL,"
+            " PRIMARY KEY (url, title))"
+        )
+        self.connection.commit()
+
+    def load(self):
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT url, title, filename, status, downloaded_bytes, total_bytes, completed FROM downloads"
+            ).fetchall()
+        return {
+            (url, title): {
+                'filename': filename,
+                'status': status,
+                'downloaded_bytes': downloaded_bytes,
+                'total_bytes': total_bytes,
+                'completed': bool(completed),
+            }
+            for url, title, filename, status, downloaded_bytes, total_bytes, completed in rows
+        }
+
+    def record(self, task, completed=False, force=False):
+        with self.lock:
+            self.pending[(task.url, task.title)] = (
+                task.url, task.title, task.filename, task.status, task.downloaded_bytes, task.total_bytes,
+                int(completed), time.time()
+            )
+            # Progress updates are batched; state changes that matter for resuming are committed right away
+            if force or time.monotonic() - self.last_flush >= self.FLUSH_INTERVAL:
+                self._flush_locked()
+
+    def flush(self):
+        with self.lock:
+            self._flush_locked()
+
+    def _flush_locked(self):
+        if self.pending:
+            with self.connection:
+                self.connection.executemany(
+                    "INSERT OR REPLACE INTO downloads"
+                    " (url, title, filename, status, downloaded_bytes, total_bytes, completed, updated)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    list(self.pending.values())
+                )
+            self.pending.clear()
+        self.last_flush = time.monotonic()
+
+    def close(self):
+        with self.lock:
+            self._flush_locked()
+            self.connection.close()
+
+
+class IntegrityManifest:
+    # Size, modification time, SHA-256 and probed duration of every verified output, keyed by file name
+    def __init__(self, directory):
+        self.path = os.path.join(directory, MANIFEST_FILENAME)
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(self.path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS files ("
+            " name TEXT PRIMARY KEY,"
+            " size INTEGER NOT NULL,"
+            " mtime_ns INTEGER NOT NULL,"
+            " sha256 TEXT NOT NULL,"
+            " duration REAL,"
+            " ok INTEGER NOT NULL,"
+            " error TEXT,"  # Why verification failed, or a warning such as a duration mismatch when ok
+            " verified REAL NOT NULL)"
+        )
+        self.connection.commit()
+
+    def record(self, path, result):
+        with self.lock, self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO files (name, size, mtime_ns, sha256, duration, ok, error, verified)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (os.path.basename(path), result['size'], result['mtime_ns'], result['sha256'], result['duration'],
+                 int(not result['error']), result['error'] or result.get('warning'), time.time())
+            )
+
+    def verified(self, path):
+        # True when the file was verified intact and its size and modification time haven't changed since
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT size, mtime_ns, ok FROM files WHERE name = ?", (os.path.basename(path),)
+            ).fetchone()
+        if row is None or not row[2]:
+            return False
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return False
+        return (stat.st_size, stat.st_mtime_ns) == (row[0], row[1])
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+
+class InfoCache:
+    # Extracted yt-dlp info dicts keyed by URL, expired after ttl seconds and trimmed to the most recently used
+    def __init__(self, directory, ttl=3600, max_entries=5000):
+        # Stream URLs inside an info dict expire after a few hours, so keep the TTL well below that
+        self.path = os.path.join(directory, INFO_CACHE_FILENAME)
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(self.path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS info ("
+            " url TEXT PRIMARY KEY,"
+            " info BLOB NOT NULL,"
+            " fetched REAL NOT NULL,"
+            " last_used REAL NOT NULL)"
+        )
+        self.connection.commit()
+
+    def get(self, url):
+        with self.lock:
+            row = self.connection.execute("SELECT info, fetched FROM info WHERE url = ?", (url,)).fetchone()
+            if row is None:
+                return None
+            with self.connection:
+                if time.time() - row[1] > self.ttl:
+                    self.connection.execute("DELETE FROM info WHERE url = ?", (url,))
+                    return None
+                self.connection.execute("UPDATE info SET last_used = ? WHERE url = ?", (time.time(), url))
+        return json.loads(zlib.decompress(row[0]))
+
+    def put(self, url, info):
+        blob = zlib.compress(json.dumps(info).encode("utf-8"))
+        now = time.time()
+        with self.lock, self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO info (url, info, fetched, last_used) VALUES (?, ?, ?, ?)",
+                (url, blob, now, now)
+            )
+
+    def invalidate(self, url):
+        with self.lock, self.connection:
+            self.connection.execute("DELETE FROM info WHERE url = ?", (url,))
+
+    def evict(self):
+        with self.lock, self.connection:
+            self.connection.execute("DELETE FROM info WHERE fetched < ?", (time.time() - self.ttl,))
+            self.connection.execute(
+                "DELETE FROM info WHERE url NOT IN (SELECT url FROM info ORDER BY last_used DESC LIMIT ?)",
+                (self.max_entries,)
+            )
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+
+class DirectoryIndex:
+    # Names in the download directory, scanned once per batch so existence checks never stat the share
+    PARTIAL_PATTERN = re.compile(r'^(.*?)(?:\.f\d+)?\.\w+\.part$')
+    TEMP_PATTERN = re.compile(r'_meta\.\w+$')
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.lock = threading.Lock()
+        self.names = set()
+        self.partial_stems = set()  # Output names with a .part file waiting to be resumed
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                self.names.add(entry.name)
+                match = self.PARTIAL_PATTERN.match(entry.name)
+                if match:
+                    self.partial_stems.add(match.group(1))
+
+    def contains(self, path):
+        if os.path.dirname(os.path.abspath(path)) != os.path.abspath(self.directory):
+            return os.path.exists(path)
+        with self.lock:
+            return os.path.basename(path) in self.names
+
+    def has_partial(self, stem):
+        with self.lock:
+            return stem in self.partial_stems
+
+    def add(self, path):
+        with self.lock:
+            self.names.add(os.path.basename(path))
+
+    def discard(self, path):
+        with self.lock:
+            self.names.discard(os.path.basename(path))
+
+    def temp_files(self):
+        with self.lock:
+            return [os.path.join(self.directory, name) for name in self.names if self.TEMP_PATTERN.search(name)]
+
+
+class RowStore:
+    # The CSV parsed once and kept column-wise; shared by the table view and the download task list
+    def __init__(self):
+        self.columns = {}  # Column name -> list of values, one per row
+        self.statuses = []
+
+    @classmethod
+    def from_csv(cls, csv_file):
+        store = cls()
+        with open(csv_file, newline='', encoding='utf-8-sig') as file:
+            reader = csv.reader(file)
+            header = next(reader, [])
+            missing_columns = [col for col in REQUIRED_COLUMNS if col not in header]
+            if missing_columns:
+                raise ValueError(f"CSV missing columns: {', '.join(missing_columns)}")
+            positions = [(name, header.index(name)) for name in REQUIRED_COLUMNS + OPTIONAL_COLUMNS
+                         if name in header]
+            store.columns = {name: [] for name, _ in positions}
+            appenders = [(store.columns[name].append, position, name in INTERNED_COLUMNS)
+                         for name, position in positions]
+            for record in reader:
+                if not record:
+                    continue
+                for append, position, interned in appenders:
+                    value = record[position] if position < len(record) else ""
+                    append(sys.intern(value) if interned else value)
+        store.statuses = ["Pending"] * len(store)
+        return store
+
+    def __len__(self):
+        return len(self.columns.get('Sermon URL', ()))
+
+    def get(self, column, index, default=""):
+        values = self.columns.get(column)
+        return values[index] if values is not None else default
+
+    def row_values(self, index):
+        return (
+            self.columns['Title - Verses'][index],
+            self.columns['Speaker'][index],
+            self.columns['Sermon Series'][index],
+            self.columns['Date'][index],
+            self.statuses[index]
+        )
+
+
+def url_host(url):
+    host = urllib.parse.urlsplit(url).hostname or ""
+    return host[4:] if host.startswith("www.") else host
+
+
+def canonical_url(url):
+    # Key under which different spellings of the same video compare equal
+    match = YOUTUBE_VIDEO_URL.match(url)
+    if match:
+        return f"youtube:{match.group(1)}"
+    parts = urllib.parse.urlsplit(url.strip())
+    host = parts.hostname or ""
+    if host.startswith("www."):
+        host = host[4:]
+    query = urllib.parse.parse_qsl(parts.query, keep_blank_values=True)
+    video_id = None
+    if host == "youtu.be":
+        video_id = parts.path.strip("/").split("/")[0]
+    elif host in YOUTUBE_HOSTS:
+        if parts.path == "/watch":
+            video_id = dict(query).get("v")
+        else:
+            match = re.match(r'/(?:shorts|embed|live|v)/([\w-]+)', parts.path)
+            video_id = match.group(1) if match else None
+    if video_id:
+        return f"youtube:{video_id}"
+    ignored = IGNORED_QUERY_PARAMETERS if host == "youtu.be" or host in YOUTUBE_HOSTS else ()
+    kept = sorted((key, value) for key, value in query if key not in ignored and not key.startswith("utm_"))
+    port = f":{parts.port}" if parts.port else ""
+    return f"{host}{port}{parts.path.rstrip('/')}?{urllib.parse.urlencode(kept)}"
+
+
+def is_retryable(error):
+    message = str(error).lower()
+    return not any(marker in message for marker in PERMANENT_ERROR_MARKERS)
+
+
+def profile_options(profile):
+    if profile in DOWNLOAD_PROFILES:
+        return dict(DOWNLOAD_PROFILES[profile])
+    match = re.fullmatch(r'video-(\d+)', profile)
+    if match:
+        height = match.group(1)
+        return {
+            'format': f'best[height<={height}][ext=mp4]/best[height<={height}]/'
+                      f'bestvideo[height<={height}]+bestaudio/best',
+            'merge_output_format': 'mp4',
+        }
+    raise ValueError(f"Unknown download profile: {profile}")
+
+
+def profile_extensions(profile):
+    return AUDIO_EXTENSIONS if profile == 'audio' else ['mp4']
+
+
+def original_size(info):
+    # Approximate what 'bestvideo+bestaudio' would fetch: the largest video-only plus the largest audio-only format
+    best = {}
+    for fmt in info.get('formats') or []:
+        size = fmt.get('filesize') or fmt.get('filesize_approx')
+        if not size:
+            continue
+        kind = 'audio' if fmt.get('vcodec') == 'none' else 'video' if fmt.get('acodec') == 'none' else 'muxed'
+        best[kind] = max(best.get(kind, 0), size)
+    if 'video' in best and 'audio' in best:
+        return max(best['video'] + best['audio'], best.get('muxed', 0))
+    return best.get('muxed') or None
+
+
+def verify_file(path, expected_duration=None):
+    # Called right after the file was written or remuxed, so the hash is read from the page cache rather than disk.
+    # ffmpeg's MP4 muxer seeks back to write the index, so the bytes can't be hashed as they stream past.
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(1024 * 1024), b''):
+            digest.update(block)
+    stat = os.stat(path)
+    # 'error' means the file is unusable; 'warning' is recorded but the file is kept
+    result = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': digest.hexdigest(), 'duration': None,
+              'error': None, 'warning': None}
+    if stat.st_size == 0:
+        result['error'] = "empty file"
+    elif shutil.which("ffprobe"):
+        # Reads only the container headers and index, which is enough to catch truncated or unreadable files
+        probe = subprocess.run(
+            ["ffprobe", "-v", "error", "-show_entries", "format=duration", "-of", "default=nw=1:nk=1", path],
+            capture_output=True, text=True, timeout=120
+        )
+        try:
+            result['duration'] = float(probe.stdout.strip())
+        except ValueError:
+            pass
+        if probe.returncode != 0 or result['duration'] is None:
+            result['error'] = probe.stderr.strip().splitlines()[-1] if probe.stderr.strip() else "unreadable container"
+        elif expected_duration and abs(result['duration'] - expected_duration) > max(2.0, expected_duration * 0.02):
+            # Extracted durations of livestream recordings are often approximate, so this alone isn't corruption
+            result['warning'] = f"duration {result['duration']:.0f}s, expected {expected_duration:.0f}s"
+    return result
+
+
+def fragments_duration(formats):
+    # Generic DASH/HLS manifests report no duration, but their fragments do
+    durations = [sum(fragment.get('duration') or 0 for fragment in fmt.get('fragments') or []) for fmt in formats]
+    return max(durations) or None
+
+
+def bitrate_size(fmt, duration):
+    # tbr is in kbit/s
+    if fmt.get('tbr') and duration:
+        return int(fmt['tbr'] * 1000 / 8 * duration)
+    return None
+
+
+def parse_priority(value):
+    try:
+        return max(float(value), 0.1)
+    except (TypeError, ValueError):
+        return 1.0
+
+
+@functools.lru_cache(maxsize=None)
+def ffmpeg_available():
+    # Cached; searching PATH can be slow on network drives
+    return shutil.which("ffmpeg") is not None
+
+
+class ConcurrencyController:
+    # AIMD: add a download while throughput keeps improving, halve the count when errors pile up
+    def __init__(self, min_limit, max_limit, initial=None, interval=5.0, error_threshold=0.2, gain_threshold=0.05,
+                 decrease_factor=0.5):
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.limit = max(min_limit, min(max_limit, initial or min_limit))
+        self.interval = interval
+        self.error_threshold = error_threshold
+        self.gain_threshold = gain_threshold
+        self.decrease_factor = decrease_factor
+        self.lock = threading.Lock()
+        self.errors = 0
+        self.successes = 0
+        self.last_bytes = 0
+        self.last_check = time.monotonic()
+        self.last_throughput = 0.0
+
+    def record_success(self):
+        with self.lock:
+            self.successes += 1
+
+    def record_error(self):
+        with self.lock:
+            self.errors += 1
+
+    def seconds_until_update(self):
+        return max(0.0, self.last_check + self.interval - time.monotonic())
+
+    def update(self, total_bytes, saturated):
+        # saturated: every allowed slot was busy, so the window measured what this limit can actually do
+        now = time.monotonic()
+        elapsed = now - self.last_check
+        if elapsed < self.interval:
+            return self.limit
+        with self.lock:
+            errors, successes = self.errors, self.successes
+            self.errors = self.successes = 0
+        throughput = (total_bytes - self.last_bytes) / elapsed
+        self.last_bytes = total_bytes
+        self.last_check = now
+
+        finished = errors + successes
+        if finished and errors / finished > self.error_threshold:
+            self.limit = max(self.min_limit, int(self.limit * self.decrease_factor))
+        elif saturated and throughput > self.last_throughput * (1 + self.gain_threshold):
+            self.limit = min(self.max_limit, self.limit + 1)
+        self.last_throughput = throughput
+        return self.limit
+
+
+class BandwidthLimiter:
+    # Token buckets per task, each refilled at the task's priority-weighted share of the global budget
+    BURST_SECONDS = 0.5
+
+    def __init__(self, rate=None):
+        self.rate = rate  # Bytes per second; None means unlimited
+        self.lock = threading.Lock()
+        self.weights = {}  # Task -> priority of every task currently transferring
+        self.buckets = {}  # Task -> [tokens, last refill time]
+
+    def set_rate(self, rate):
+        with self.lock:
+            self.rate = rate or None
+
+    def register(self, task):
+        with self.lock:
+            self.weights[task] = task.priority
+            self.buckets[task] = [0.0, time.monotonic()]
+
+    def unregister(self, task):
+        with self.lock:
+            self.weights.pop(task, None)
+            self.buckets.pop(task, None)
+
+    def consume(self, task, nbytes):
+        # Blocks the calling download thread until its share of the budget covers nbytes
+        with self.lock:
+            if not self.rate or task not in self.buckets:
+                return
+            share = self.rate * self.weights[task] / sum(self.weights.values())
+            bucket = self.buckets[task]
+            now = time.monotonic()
+            bucket[0] = min(bucket[0] + (now - bucket[1]) * share, share * self.BURST_SECONDS)
+            bucket[1] = now
+            bucket[0] -= nbytes
+            delay = -bucket[0] / share if bucket[0] < 0 else 0
+        if delay > 0:
+            time.sleep(delay)
+
+
+class ConnectionBudget:
+    # Fragment connections shared by all transferring tasks. yt-dlp sizes its fragment pool when a format starts,
+    # so leases are re-evaluated at format boundaries and tasks started near the end of a batch get a larger share.
+    def __init__(self, total):
+        self.total = total
+        self.lock = threading.Lock()
+        self.leases = {}  # Task -> fragment connections granted
+
+    def lease(self, task, peers=0):
+        # peers: transfers expected to run alongside this one, so the first of a burst doesn't take everything
+        with self.lock:
+            self.leases.pop(task, None)
+            # An even share, but never more than other leases have left over; yt-dlp can't shrink a running pool
+            share = self.total // max(len(self.leases) + 1, peers)
+            self.leases[task] = max(1, min(share, self.total - sum(self.leases.values())))
+            return self.leases[task]
+
+    def release(self, task):
+        with self.lock:
+            self.leases.pop(task, None)
+
+
+class RetryPolicy:
+    def __init__(self, max_attempts=5, base_delay=5.0, max_delay=300.0, jitter=0.5):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.jitter = jitter  # Fraction of the delay that is randomised, so retries from a burst spread out
+
+    def delay(self, attempt):
+        delay = min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+        return random.uniform(delay * (1 - self.jitter), delay)
+
+
+class CircuitBreaker:
+    # Per host: open after too many recent failures, hold dispatches for the cooldown, then let one probe through
+    def __init__(self, window=10, failure_threshold=0.5, min_samples=4, cooldown=60.0):
+        self.window = window
+        self.failure_threshold = failure_threshold
+        self.min_samples = min_samples
+        self.cooldown = cooldown
+        self.lock = threading.Lock()
+        self.outcomes = {}  # Host -> deque of recent results, True for success
+        self.opened_at = {}  # Host -> time the breaker opened
+        self.probing = {}  # Host -> task let through as the half-open probe
+
+    def record(self, host, success, task=None):
+        with self.lock:
+            if host in self.opened_at:
+                # Only the half-open probe decides whether the host is healthy again; results of downloads
+                # that were already running when the breaker opened are ignored
+                if task is None or self.probing.get(host) is not task:
+                    return
+                del self.probing[host]
+                if success:
+                    del self.opened_at[host]
+                    self.outcomes.pop(host, None)
+                else:
+                    self.opened_at[host] = time.monotonic()
+                return
+            outcomes = self.outcomes.setdefault(host, collections.deque(maxlen=self.window))
+            outcomes.append(success)
+            failures = outcomes.count(False)
+            if len(outcomes) >= self.min_samples and failures / len(outcomes) >= self.failure_threshold:
+                self.opened_at[host] = time.monotonic()
+
+    def allows(self, host, task=None):
+        with self.lock:
+            opened_at = self.opened_at.get(host)
+            if opened_at is None:
+                return True
+            if time.monotonic() - opened_at < self.cooldown or host in self.probing:
+                return False
+            self.probing[host] = task
+            return True
+
+    def release(self, host, task):
+        # A probe that ended without a download result (cancelled, file already there) lets the next one through
+        with self.lock:
+            if host in self.probing and self.probing[host] is task:
+                del self.probing[host]
+
+    def state(self, host):
+        with self.lock:
+            if host not in self.opened_at:
+                return "closed"
+            if host in self.probing or time.monotonic() - self.opened_at[host] >= self.cooldown:
+                return "half-open"
+            return "open"
+
+    def seconds_until_change(self):
+        with self.lock:
+            waits = [opened_at + self.cooldown - time.monotonic()
+                     for host, opened_at in self.opened_at.items() if host not in self.probing]
+        return max(0.0, min(waits)) if waits else None
+
+
+class Metrics:
+    # Per-task phase spans and batch counters, written as a JSON-lines event log and a Prometheus text file
+    PREFIX = "sermon_downloader_"
+
+    def __init__(self, event_log=None, prometheus_file=None, export_interval=10.0):
+        self.lock = threading.Lock()
+        self.counters = collections.Counter()  # (name, sorted label items) -> value
+        self.spans = {}  # (task index, phase) -> start time of an open span
+        self.collectors = []  # Callables returning {name: value} sampled at export time
+        self.prometheus_file = prometheus_file
+        self.export_interval = export_interval
+        self.log = open(event_log, "a", encoding="utf-8") if event_log else None
+        self.stopped = threading.Event()
+        self.exporter = None
+
+    def increment(self, name, value=1, **labels):
+        with self.lock:
+            self.counters[(name, tuple(sorted(labels.items())))] += value
+
+    def event(self, kind, **fields):
+        if self.log:
+            line = json.dumps(dict(time=round(time.time(), 3), event=kind, **fields))
+            with self.lock:
+                self.log.write(line + "\n")
+
+    def start_span(self, task, phase):
+        with self.lock:
+            self.spans[(task.index, phase)] = time.monotonic()
+
+    def in_span(self, task, phase):
+        # Lock-free membership test for the progress hook's hot path
+        return (task.index, phase) in self.spans
+
+    def end_span(self, task, phase, ok=True):
+        with self.lock:
+            started = self.spans.pop((task.index, phase), None)
+        if started is None:
+            return
+        seconds = time.monotonic() - started
+        self.increment("phase_seconds_total", seconds, phase=phase)
+        self.increment("phase_total", phase=phase, outcome="ok" if ok else "error")
+        self.event("span", task=task.index, title=task.title, phase=phase, seconds=round(seconds, 4), ok=ok)
+
+    @contextlib.contextmanager
+    def span(self, task, phase):
+        self.start_span(task, phase)
+        ok = False
+        try:
+            yield
+            ok = True
+        finally:
+            self.end_span(task, phase, ok)
+
+    def prometheus_text(self):
+        samples = collections.defaultdict(list)
+        with self.lock:
+            for (name, labels), value in self.counters.items():
+                samples[name].append((labels, value))
+        for collect in self.collectors:
+            for name, value in collect().items():
+                samples[name].append(((), value))
+        lines = []
+        for name in sorted(samples):
+            kind = "counter" if name.endswith("_total") else "gauge"
+            lines.append(f"# TYPE {self.PREFIX}{name} {kind}")
+            for labels, value in sorted(samples[name]):
+                value = value if isinstance(value, int) else round(value, 6)
+                label_text = ",".join(f'{key}="{label}"' for key, label in labels)
+                lines.append(f"{self.PREFIX}{name}{{{label_text}}} {value}" if labels
+                             else f"{self.PREFIX}{name} {value}")
+        return "\n".join(lines) + "\n"
+
+    def export(self):
+        if not self.prometheus_file:
+            return
+        # Written to a temporary file and renamed so a scraper never sees half a file
+        temp_file = f"{self.prometheus_file}.tmp"
+        with open(temp_file, "w", encoding="utf-8") as file:
+            file.write(self.prometheus_text())
+        os.replace(temp_file, self.prometheus_file)
+        if self.log:
+            with self.lock:
+                self.log.flush()
+
+    def start(self):
+        self.stopped.clear()
+        if (self.prometheus_file or self.log) and not self.exporter:
+            self.exporter = threading.Thread(target=self.export_loop, daemon=True)
+            self.exporter.start()
+
+    def export_loop(self):
+        while not self.stopped.wait(self.export_interval):
+            self.export()
+
+    def stop(self):
+        self.stopped.set()
+        if self.exporter:
+            self.exporter.join()
+            self.exporter = None
+        self.export()
+
+    def close(self):
+        self.stop()
+        if self.log:
+            self.log.close()
+            self.log = None
+
+
+class BatchProfiler:
+    # cProfile and tracemalloc for a single batch, written to <prefix>.prof and <prefix>.tracemalloc.txt
+    # Before Python 3.12 a profiler only sees its own thread, so every worker call gets one and they are merged
+    PER_THREAD = sys.version_info < (3, 12)
+
+    def __init__(self, prefix):
+        self.prefix = prefix
+        self.lock = threading.Lock()
+        self.stats = None
+        self.profiler = None
+
+    # The profiling modules are imported on use so they don't add to startup time
+    def start(self):
+        import cProfile
+        import tracemalloc
+        tracemalloc.start()
+        self.profiler = cProfile.Profile()
+        self.profiler.enable()
+
+    def wrap(self, func):
+        if not self.PER_THREAD:
+            return func
+
+        import cProfile
+
+        def profiled(*args):
+            profiler = cProfile.Profile()
+            try:
+                return profiler.runcall(func, *args)
+            finally:
+                self.merge(profiler)
+        return profiled
+
+    def merge(self, profiler):
+        import pstats
+        with self.lock:
+            if self.stats is None:
+                self.stats = pstats.Stats(profiler)
+            else:
+                self.stats.add(profiler)
+
+    def stop(self):
+        self.profiler.disable()
+        self.merge(self.profiler)
+        self.stats.dump_stats(f"{self.prefix}.prof")
+        import tracemalloc
+        snapshot = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+        with open(f"{self.prefix}.tracemalloc.txt", "w", encoding="utf-8") as file:
+            for stat in snapshot.statistics("lineno")[:50]:
+                file.write(f"{stat}\n")
+
+
+class EngineListener:
+    # Called from worker threads; implementations must not touch GUI toolkits directly
+    def task_updated(self, slot, task):
+        pass
+
+    def status_changed(self, task):
+        pass
+
+    def slot_cleared(self, slot):
+        pass
+
+    def batch_finished(self):
+        pass
+
+    def concurrency_changed(self, limit):
+        pass
+
+    def preflight_finished(self, total_bytes, total_duration, failed, bytes_saved):
+        pass
+
+    def duplicates_resolved(self, downloads_saved, bytes_saved):
+        pass
+
+
+class DownloadEngine:
+    def __init__(self, max_concurrent_downloads=10, listener=None, quiet=False, min_concurrent_downloads=None,
+                 initial_concurrent_downloads=None, bandwidth_limit=None, preflight_workers=4, retry_policy=None,
+                 circuit_breaker=None, profile='original', connection_budget=None, postprocess_workers=2,
+                 postprocess_backlog=4, metrics=None, profile_prefix=None, scheduling_policy='csv',
+                 verify_existing=False):
+        # max_concurrent_downloads is the number of slots; without a minimum every slot is always used
+        self.max_concurrent_downloads = max_concurrent_downloads
+        self.listener = listener or EngineListener()
+        self.quiet = quiet
+        self.controller = None
+        self.concurrency_limit = max_concurrent_downloads
+        if min_concurrent_downloads is not None and min_concurrent_downloads < max_concurrent_downloads:
+            self.controller = ConcurrencyController(min_concurrent_downloads, max_concurrent_downloads,
+                                                    initial=initial_concurrent_downloads)
+            self.concurrency_limit = self.controller.limit
+        self.executor = ThreadPoolExecutor(max_workers=self.max_concurrent_downloads)
+        # ffmpeg tagging runs in its own pool so a slow remux doesn't hold a download slot
+        self.postprocessor = ThreadPoolExecutor(max_workers=postprocess_workers)
+        # Finished downloads wait in their slot while the post-processing stage is full, which keeps
+        # the number of untagged files bounded and throttles dispatch to the speed of the disk
+        self.postprocess_capacity = threading.BoundedSemaphore(postprocess_workers + postprocess_backlog)
+        self.postprocess_queued = 0
+        self.postprocess_running = 0
+        self.download_tasks = []
+        self.scheduling_policy = scheduling_policy
+        self.pending_tasks = TaskQueue(scheduling_policy)
+        self.retry_tasks = []  # Heap of (ready time, sequence, task) for failed tasks waiting out their backoff
+        self.retry_sequence = itertools.count()
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.breaker = circuit_breaker or CircuitBreaker()
+        self.slot_available = threading.Condition()  # Signalled whenever a worker releases its slot
+        self.active_slots = {}  # Maps slot to current task
+        self.download_path = ""
+        self.journal = None
+        self.info_cache = None
+        self.directory_index = None
+        self.manifest = None
+        # Verify files from earlier runs that the manifest doesn't vouch for; reads them once
+        self.verify_existing = verify_existing
+        self.preflight_workers = preflight_workers
+        self.default_profile = profile  # Used for rows without a Profile column value
+        self.running = True
+        self.stats_lock = threading.Lock()
+        self.bytes_downloaded = 0  # Bytes received across all tasks in this batch
+        self.bandwidth = BandwidthLimiter(bandwidth_limit)
+        self.duplicates = {}  # Task downloaded once -> rows for the same video, produced locally from its file
+        self.dedup_downloads_saved = 0
+        self.dedup_bytes_saved = 0
+        self.worker_state = threading.local()  # Each download thread keeps its YoutubeDL objects between tasks
+        self.downloaders = []  # Every YoutubeDL handed out, closed on shutdown
+        # DASH/HLS fragments fetched in parallel; by default twice the download slots
+        self.connections = ConnectionBudget(connection_budget or 2 * max_concurrent_downloads)
+        self.batch_started = None
+        self.metrics = metrics or Metrics()
+        self.metrics.collectors.append(self.collect_metrics)
+        self.profile_prefix = profile_prefix  # Profile the next batch with cProfile and tracemalloc when set
+
+    def load_tasks(self, rows, download_path):
+        self.download_path = download_path
+        if self.journal:
+            self.journal.close()
+        self.journal = DownloadJournal(download_path)
+        journal_entries = self.journal.load()
+        if self.info_cache:
+            self.info_cache.close()
+        self.info_cache = InfoCache(download_path)
+        self.directory_index = DirectoryIndex(download_path)
+        if self.manifest:
+            self.manifest.close()
+        self.manifest = IntegrityManifest(download_path)
+
+        self.download_tasks = []
+        self.pending_tasks = TaskQueue(self.scheduling_policy)
+        self.retry_tasks = []
+        dates = {}  # Dates repeat across rows; parse each one once into (year, ordinal)
+        profiles = set()
+        output_names = {}  # Sanitized title -> URL of the first row saved under it
+        sources = {}  # (canonical URL, profile) -> first row for that video
+        self.duplicates = {}
+        self.dedup_downloads_saved = 0
+        self.dedup_bytes_saved = 0
+        # Rows become long-lived objects without reference cycles; collecting while they are created only
+        # rescans the growing batch, which made loading superlinear in the row count
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            for idx in range(len(rows)):
+                date = rows.get('Date', idx)
+                if date not in dates:
+                    try:
+                        parsed = datetime.datetime.strptime(date, '%Y-%m-%d')
+                        dates[date] = (parsed.year, parsed.toordinal())
+                    except ValueError:
+                        dates[date] = ("", 0)
+                task = DownloadTask(
+                    url=rows.get('Sermon URL', idx),
+                    title=rows.get('Title - Verses', idx),
+                    save_path=download_path,
+                    speaker=rows.get('Speaker', idx),
+                    sermon_series=rows.get('Sermon Series', idx),
+                    year=dates[date][0],
+                    date_ordinal=dates[date][1],
+                    index=idx,
+                    priority=parse_priority(rows.get('Priority', idx, None)),
+                    profile=rows.get('Profile', idx).strip() or self.default_profile
+                )
+                if task.profile not in profiles:
+                    profile_options(task.profile)  # Raises for an unknown profile before anything is downloaded
+                    profiles.add(task.profile)
+                source = sources.setdefault((canonical_url(task.url), task.profile), task)
+                task.output_name = self.sanitize_filename(task.title)
+                owner = output_names.setdefault(task.output_name, task.url)
+                if owner != task.url:
+                    # A different video whose title sanitizes to the same name; the first row keeps the plain name
+                    task.output_name = f"{task.output_name} [{zlib.crc32(task.url.encode()):08x}]"
+                    output_names.setdefault(task.output_name, task.url)
+                if source is not task and task.output_name == source.output_name and not self.same_tags(task, source):
+                    # The same sermon listed under another series or speaker gets its own file with its own tags
+                    name = f"{task.output_name} [{self.sanitize_filename(task.sermon_series) or task.index + 1}]"
+                    if name in output_names:
+                        name = f"{task.output_name} [row {task.index + 1}]"
+                    output_names[name] = task.url
+                    task.output_name = name
+                self.download_tasks.append(task)
+                # A duplicate with the source's URL and title would share its journal row, so it isn't journaled
+                entry = journal_entries.get((task.url, task.title)) if self.journaled(source, task) else None
+                if entry:
+                    task.filename = entry['filename']
+                    if entry['completed'] and task.filename and self.directory_index.contains(task.filename) and (
+                            not self.verify_existing or self.manifest.verified(task.filename)):
+                        task.status = "Completed (Journal)"
+                        task.progress = 100
+                        self.listener.status_changed(task)
+                        continue
+                    # yt-dlp picks the .part file back up through continuedl
+                    if not entry['completed']:
+                        task.downloaded_bytes = entry['downloaded_bytes']
+                        task.total_bytes = entry['total_bytes']
+                if source is not task:
+                    # Same video as an earlier row; its output is linked or copied from that row's file
+                    task.status = f"Duplicate of row {source.index + 1}"
+                    self.duplicates.setdefault(source, []).append(task)
+                    self.listener.status_changed(task)
+                    continue
+                if task.downloaded_bytes or self.directory_index.has_partial(task.output_name):
+                    task.status = "Pending (Resume)"
+                    self.listener.status_changed(task)
+                self.pending_tasks.append(task)
+        finally:
+            if gc_enabled:
+                gc.enable()
+        return self.download_tasks
+
+    def start(self):
+        threading.Thread(target=self.process_tasks, daemon=True).start()
+
+    def process_tasks(self):
+        self.batch_started = time.monotonic()
+        profiler = BatchProfiler(self.profile_prefix) if self.profile_prefix else None
+        if profiler:
+            profiler.start()
+            self.profile_prefix = None  # One batch only
+        self.metrics.start()
+        self.metrics.event("batch_started", tasks=len(self.download_tasks), pending=len(self.pending_tasks))
+        # Duplicates of rows finished in an earlier run are produced from the existing files right away
+        for source in list(self.duplicates):
+            if source.status in FINISHED_STATUSES and source.status != "Terminated":
+                self.submit_duplicates(source)
+        self.preflight()
+        with self.slot_available:
+            self.pending_tasks.rekey()  # Size and duration are known now
+            while self.running:
+                self.requeue_due_retries()
+                # Dispatch as many pending tasks as there are free slots
+                while self.pending_tasks:
+                    available_slot = self.find_free_slot()
+                    if available_slot is None:
+                        break
+                    task = self.next_dispatchable_task()
+                    if task is None:
+                        break
+                    if task.resume_event is None:
+                        task.resume_event = threading.Event()
+                        task.resume_event.set()
+                    self.active_slots[available_slot] = task
+                    self.listener.task_updated(available_slot, task)
+                    download = profiler.wrap(self.download_video) if profiler else self.download_video
+                    self.executor.submit(download, task, available_slot)
+
+                if not (self.pending_tasks or self.active_slots or self.retry_tasks or self.postprocess_depth()):
+                    break
+                # Sleep until a worker releases its slot, a backoff expires, a breaker cools down or
+                # the concurrency controller is due
+                self.slot_available.wait(self.next_wakeup())
+                if self.controller:
+                    self.adjust_concurrency()
+
+        self.journal.flush()
+        self.metrics.event("batch_finished", seconds=round(time.monotonic() - self.batch_started, 3),
+                           bytes=self.bytes_downloaded, duplicates_saved=self.dedup_downloads_saved,
+                           duplicate_bytes_saved=self.dedup_bytes_saved)
+        self.metrics.stop()
+        if profiler:
+            profiler.stop()
+        if self.dedup_downloads_saved:
+            self.listener.duplicates_resolved(self.dedup_downloads_saved, self.dedup_bytes_saved)
+        self.listener.batch_finished()
+
+    def collect_metrics(self):
+        return {
+            "bytes_downloaded_total": self.bytes_downloaded,
+            "active_downloads": len(self.active_slots),
+            "queued_downloads": len(self.pending_tasks),
+            "retry_waiting": len(self.retry_tasks),
+            "postprocess_running": self.postprocess_running,
+            "postprocess_queued": self.postprocess_queued,
+            "concurrency_limit": self.concurrency_limit,
+        }
+
+    def requeue_due_retries(self):
+        now = time.monotonic()
+        while self.retry_tasks and self.retry_tasks[0][0] <= now:
+            task = heapq.heappop(self.retry_tasks)[2]
+            task.status = f"Pending (Retry {task.attempts}/{self.retry_policy.max_attempts - 1})"
+            self.listener.status_changed(task)
+            # Retries go to the front so a task that already started is finished first
+            self.pending_tasks.appendleft(task)
+
+    def next_dispatchable_task(self):
+        def dispatchable(task):
+            host = url_host(task.url)
+            if self.breaker.allows(host, task):
+                return True
+            status = f"Waiting ({host} {self.breaker.state(host)})"
+            if task.status != status:
+                task.status = status
+                self.listener.status_changed(task)
+            return False
+        return self.pending_tasks.pop(dispatchable, DISPATCH_LOOKAHEAD)
+
+    def set_scheduling_policy(self, policy):
+        with self.slot_available:
+            self.pending_tasks.set_policy(policy)
+            self.scheduling_policy = policy
+
+    def set_queue_order(self, indices):
+        # Manual order from the GUI: row indices in the order they should be downloaded
+        with self.slot_available:
+            for rank, index in enumerate(indices):
+                if index < len(self.download_tasks):
+                    self.download_tasks[index].rank = rank
+            self.pending_tasks.set_policy('manual')
+            self.scheduling_policy = 'manual'
+
+    def next_wakeup(self):
+        waits = []
+        if self.retry_tasks:
+            waits.append(max(0.0, self.retry_tasks[0][0] - time.monotonic()))
+        if self.pending_tasks:
+            waits.append(self.breaker.seconds_until_change())
+        if self.controller:
+            waits.append(self.controller.seconds_until_update())
+        waits = [wait for wait in waits if wait is not None]
+        return min(waits) if waits else None
+
+    def schedule_retry(self, task, error):
+        # Hand the task back to the scheduler instead of retrying here, so the slot is freed for other work
+        task.attempts += 1
+        if not is_retryable(error) or task.attempts >= self.retry_policy.max_attempts:
+            return False
+        delay = self.retry_policy.delay(task.attempts)
+        self.metrics.increment("retries_total")
+        self.metrics.event("retry", task=task.index, attempt=task.attempts, delay=round(delay, 2))
+        task.status = f"Retry {task.attempts}/{self.retry_policy.max_attempts - 1} in {int(delay)}s"
+        with self.slot_available:
+            heapq.heappush(self.retry_tasks, (time.monotonic() + delay, next(self.retry_sequence), task))
+        return True
+
+    def base_ydl_opts(self, profile):
+        return dict(profile_options(profile), quiet=self.quiet, noprogress=self.quiet)
+
+    def downloader(self, profile):
+        # Building a YoutubeDL costs tens of milliseconds, so each worker thread reuses one per profile and
+        # download_video swaps the per-task options in; the hooks look the current task up in `current`
+        downloaders = self.worker_state.__dict__.setdefault("downloaders", {})
+        if profile not in downloaders:
+            current = {}
+            ydl = yt_dlp.YoutubeDL(dict(self.base_ydl_opts(profile), **{
+                'progress_hooks': [lambda d: self.progress_hook(d, current['task'], current['slot'])],
+                'postprocessor_hooks': [lambda d: self.postprocessor_hook(d, current['task'])],
+                'continuedl': True,  # Enable resuming partial downloads
+                # Fixed read size keeps progress hooks, and so bandwidth shaping, at a fine granularity
+                'buffersize': 128 * 1024,
+                'noresizebuffer': True,
+            }))
+            downloaders[profile] = (ydl, current)
+            with self.stats_lock:
+                self.downloaders.append(ydl)
+        return downloaders[profile]
+
+    def cache_key(self, task):
+        # Format selection stored in the info dict depends on the profile
+        return task.url if task.profile == 'original' else f"{task.profile}|{task.url}"
+
+    def preflight(self):
+        # Extract info for every queued URL up front so downloads, resumes and retries never re-extract
+        tasks = list(self.pending_tasks)
+        workers = threading.local()
+
+        def extract(task):
+            if task.terminated or not self.running:
+                return
+            info = self.info_cache.get(self.cache_key(task))
+            if info is None:
+                task.status = "Extracting Info"
+                self.listener.status_changed(task)
+                if not hasattr(workers, "ydls"):
+                    workers.ydls = {}
+                if task.profile not in workers.ydls:
+                    workers.ydls[task.profile] = yt_dlp.YoutubeDL(self.base_ydl_opts(task.profile))
+                ydl = workers.ydls[task.profile]
+                try:
+                    with self.metrics.span(task, "extract"):
+                        info = ydl.sanitize_info(ydl.extract_info(task.url, download=False))
+                except Exception as e:
+                    # The download itself will extract again and report the error properly
+                    task.status = "Pending (Info Failed)"
+                    self.listener.status_changed(task)
+                    print(f"Pre-flight extraction failed for {task.url}: {e}")
+                    return
+                self.info_cache.put(self.cache_key(task), info)
+            formats = info.get('requested_formats') or [info]
+            task.duration = info.get('duration') or fragments_duration(formats)
+            sizes = [fmt.get('filesize') or fmt.get('filesize_approx') or bitrate_size(fmt, task.duration)
+                     for fmt in formats]
+            task.expected_bytes = sum(sizes) if all(sizes) else None
+            task.fragmented = any(fmt.get('fragments') or fmt.get('protocol') in FRAGMENTED_PROTOCOLS
+                                  for fmt in formats)
+            task.original_bytes = original_size(info) if task.profile != 'original' else task.expected_bytes
+            if task.status == "Extracting Info":
+                task.status = "Pending"
+                self.listener.status_changed(task)
+
+        with ThreadPoolExecutor(max_workers=self.preflight_workers) as preflight_executor:
+            list(preflight_executor.map(extract, tasks))
+        self.info_cache.evict()
+
+        total_bytes = sum(task.expected_bytes or 0 for task in tasks)
+        total_duration = sum(task.duration or 0 for task in tasks)
+        failed = sum(1 for task in tasks if task.status == "Pending (Info Failed)")
+        bytes_saved = sum(max(0, task.original_bytes - task.expected_bytes) for task in tasks
+                          if task.original_bytes and task.expected_bytes)
+        self.listener.preflight_finished(total_bytes, total_duration, failed, bytes_saved)
+
+    def adjust_concurrency(self):
+        saturated = len(self.active_slots) >= self.concurrency_limit
+        limit = self.controller.update(self.bytes_downloaded, saturated)
+        if limit != self.concurrency_limit:
+            self.concurrency_limit = limit
+            self.listener.concurrency_changed(limit)
+
+    def set_bandwidth_limit(self, rate):
+        self.bandwidth.set_rate(rate)
+
+    def find_free_slot(self):
+        # Slots above a lowered limit drain naturally; new work only starts below it
+        if len(self.active_slots) >= self.concurrency_limit:
+            return None
+        for slot in range(self.max_concurrent_downloads):
+            if slot not in self.active_slots:
+                return slot
+        return None
+
+    def release_slot(self, slot, task):
+        with self.slot_available:
+            if self.active_slots.get(slot) is task:
+                del self.active_slots[slot]
+            self.slot_available.notify_all()
+
+    def clear_slot(self, slot, task):
+        self.listener.slot_cleared(slot)
+        self.release_slot(slot, task)
+
+    def pause_all(self):
+        for slot in range(self.max_concurrent_downloads):
+            if slot in self.active_slots and self.active_slots[slot].status == "Downloading":
+                self.toggle_pause(slot)
+
+    def resume_all(self):
+        for slot in range(self.max_concurrent_downloads):
+            if slot in self.active_slots and self.active_slots[slot].status == "Paused":
+                self.toggle_pause(slot)
+
+    def cancel_all(self):
+        for slot in range(self.max_concurrent_downloads):
+            self.terminate_download(slot)
+
+    def toggle_pause(self, slot):
+        if slot in self.active_slots:
+            task = self.active_slots[slot]
+            if task.status in ["Downloading", "Paused"]:
+                task.paused = not task.paused
+                task.status = "Paused" if task.paused else "Downloading"
+                # The worker keeps its YoutubeDL session and connection and simply waits on this event
+                if task.paused:
+                    task.resume_event.clear()
+                else:
+                    task.resume_event.set()
+                self.listener.task_updated(slot, task)
+
+    def terminate_download(self, slot):
+        if slot in self.active_slots:
+            task = self.active_slots[slot]
+            if task.status in ["Downloading", "Paused"]:
+                task.terminated = True
+                task.resume_event.set()  # Wake a paused worker so it can exit
+                task.status = "Terminated"
+                self.listener.status_changed(task)
+                self.journal.record(task, force=True)
+                # Clean up partial file
+                if task.partial_file and os.path.exists(task.partial_file):
+                    os.remove(task.partial_file)
+                    self.directory_index.discard(task.partial_file)
+                self.fail_duplicates(task)
+                self.clear_slot(slot, task)
+
+    def sanitize_filename(self, title):
+        invalid_chars = r'[<>:"/\\|?*]'
+        safe_title = re.sub(invalid_chars, '_', title)
+        safe_title = re.sub(r'_+', '_', safe_title)
+        return safe_title.strip('_ ').strip()
+
+    def download_video(self, task, slot):
+        try:
+            task.status = "Downloading"
+            self.listener.task_updated(slot, task)
+            candidates = [os.path.join(task.save_path, f"{task.output_name}.{ext}")
+                          for ext in profile_extensions(task.profile)]
+            if not task.filename:
+                task.filename = candidates[0]
+            self.journal.record(task, force=True)
+
+            existing = [path for path in candidates if self.directory_index.contains(path)]
+            if existing:
+                task.filename = existing[0]
+                if self.verify_existing and not self.manifest.verified(task.filename):
+                    self.submit_postprocess(task, slot, tag=False, status="Completed (Exists)")
+                    return
+                task.status = "Completed (Exists)"
+                self.metrics.increment("downloads_total", status="exists")
+                self.journal.record(task, completed=True, force=True)
+                self.listener.task_updated(slot, task)
+                self.submit_duplicates(task)
+                return
+
+            ydl, current = self.downloader(task.profile)
+            current.update(task=task, slot=slot)
+            ydl.params['outtmpl']['default'] = f'{task.save_path}/{task.output_name}.%(ext)s'
+            # Progressive downloads use a single connection; unknown formats (pre-flight failed) are leased too
+            ydl.params['concurrent_fragment_downloads'] = (
+                1 if task.fragmented is False else self.connections.lease(task, len(self.active_slots)))
+            # Tag the file in the same ffmpeg pass that merges video and audio
+            ydl.params['postprocessor_args'] = {
+                'merger+ffmpeg_o': self.metadata_args(task.title, task.speaker, task.sermon_series, task.year)
+            }
+
+            # Paused between dispatch and here: wait before opening a connection
+            task.resume_event.wait()
+            if not task.terminated:
+                self.bandwidth.register(task)
+                try:
+                    task.process = ydl
+                    self.metrics.start_span(task, "first_byte")
+                    info = self.download_info(ydl, task)
+                    self.metrics.end_span(task, "transfer")
+                    task.filename = ydl.prepare_filename(info)
+                    task.partial_file = None  # Clear partial file on completion
+                    if not task.terminated:
+                        self.metrics.increment("downloads_total", status="downloaded")
+                        self.breaker.record(url_host(task.url), True, task)
+                        if self.controller:
+                            self.controller.record_success()
+                        # Single-file formats skip the merger, so they still need a separate tagging pass
+                        self.submit_postprocess(task, slot, tag=not info.get('requested_formats'))
+                except yt_dlp.utils.DownloadError:
+                    if not task.terminated:
+                        raise
+
+        except Exception as e:
+            if not task.terminated:
+                self.metrics.increment("errors_total", error=type(e).__name__,
+                                       retryable=str(is_retryable(e)).lower())
+                self.metrics.event("error", task=task.index, title=task.title, error=str(e))
+                self.breaker.record(url_host(task.url), False, task)
+                if self.controller:
+                    self.controller.record_error()
+                if not self.schedule_retry(task, e):
+                    task.status = f"Error: {str(e)}"
+                    self.fail_duplicates(task)
+                self.journal.record(task, force=True)
+                self.listener.task_updated(slot, task)
+        finally:
+            self.breaker.release(url_host(task.url), task)
+            self.bandwidth.unregister(task)
+            self.connections.release(task)
+            # Spans still open here belong to a failed or cancelled attempt
+            for phase in ("first_byte", "transfer", "merge"):
+                self.metrics.end_span(task, phase, ok=False)
+            # Terminated tasks have already given their slot back
+            if not task.terminated:
+                self.clear_slot(slot, task)
+
+    def submit_postprocess(self, task, slot, tag=True, status="Completed"):
+        task.status = "Waiting for Post-processing"
+        self.listener.task_updated(slot, task)
+        while not self.postprocess_capacity.acquire(timeout=1):
+            if not self.running:
+                return
+        with self.stats_lock:
+            self.postprocess_queued += 1
+        task.status = "Queued for Post-processing"
+        self.listener.task_updated(slot, task)
+        self.postprocessor.submit(self.postprocess, task, tag, status)
+
+    def postprocess(self, task, tag, status):
+        with self.stats_lock:
+            self.postprocess_queued -= 1
+            self.postprocess_running += 1
+        try:
+            if self.running:
+                if tag:
+                    task.status = "Adding Metadata"
+                    self.listener.status_changed(task)
+                    with self.metrics.span(task, "metadata"):
+                        self.add_metadata(task.filename, task.title, task.speaker, task.sermon_series, task.year)
+                task.status = "Verifying"
+                self.listener.status_changed(task)
+                try:
+                    with self.metrics.span(task, "verify"):
+                        result = verify_file(task.filename, task.duration)
+                except Exception as e:
+                    error = str(e)
+                else:
+                    self.manifest.record(task.filename, result)
+                    error = result['error']
+                    if result['warning']:
+                        self.metrics.event("verify_warning", task=task.index, title=task.title,
+                                           warning=result['warning'])
+                if error:
+                    self.reject_corrupt(task, error)
+                else:
+                    self.complete_task(task, status)
+                self.listener.status_changed(task)
+        finally:
+            with self.stats_lock:
+                self.postprocess_running -= 1
+            self.postprocess_capacity.release()
+            # The batch only finishes once the post-processing stage has drained
+            with self.slot_available:
+                self.slot_available.notify_all()
+
+    def postprocess_depth(self):
+        with self.stats_lock:
+            return self.postprocess_queued + self.postprocess_running
+
+    def reject_corrupt(self, task, error):
+        # Drop the file and send the task back through the retry queue to be downloaded again
+        self.metrics.increment("verify_failures_total")
+        self.metrics.event("corrupt", task=task.index, title=task.title, error=error)
+        if os.path.exists(task.filename):
+            os.remove(task.filename)
+        self.directory_index.discard(task.filename)
+        task.downloaded_bytes = 0
+        task.current_format = None
+        error = ValueError(f"Corrupt download ({error})")
+        if not self.schedule_retry(task, error):
+            task.status = f"Error: {error}"
+            self.fail_duplicates(task)
+        self.journal.record(task, force=True)
+
+    def complete_task(self, task, status="Completed"):
+        task.status = status
+        self.metrics.increment("downloads_total", status="completed" if status == "Completed" else "exists")
+        self.directory_index.add(task.filename)
+        self.journal.record(task, completed=True, force=True)
+        self.submit_duplicates(task)
+
+    def submit_duplicates(self, source):
+        with self.slot_available:
+            duplicates = self.duplicates.pop(source, None)
+        if not duplicates:
+            return
+        with self.stats_lock:
+            self.postprocess_queued += 1
+        self.postprocessor.submit(self.produce_duplicates, source, duplicates)
+
+    def produce_duplicates(self, source, duplicates):
+        # Runs in the post-processing pool: the work is local disk I/O, not network
+        with self.stats_lock:
+            self.postprocess_queued -= 1
+            self.postprocess_running += 1
+        try:
+            for task in duplicates:
+                if not self.running:
+                    break
+                try:
+                    self.produce_duplicate(source, task)
+                except Exception as e:
+                    task.status = f"Error: {e}"
+                    if self.journaled(source, task):
+                        self.journal.record(task, force=True)
+                self.listener.status_changed(task)
+        finally:
+            with self.stats_lock:
+                self.postprocess_running -= 1
+            with self.slot_available:
+                self.slot_available.notify_all()
+
+    def produce_duplicate(self, source, task):
+        task.filename = os.path.join(task.save_path, task.output_name + os.path.splitext(source.filename)[1])
+        task.duration = source.duration
+        if self.directory_index.contains(task.filename):
+            task.status = "Completed (Exists)"
+            if self.journaled(source, task):
+                self.journal.record(task, completed=True, force=True)
+            return
+        if self.same_tags(task, source):
+            # Identical tags, so the bytes are identical too; a hardlink costs no space at all
+            try:
+                os.link(source.filename, task.filename)
+                task.status = "Completed (Linked)"
+            except OSError:
+                shutil.copyfile(source.filename, task.filename)
+                task.status = "Completed (Copied)"
+        else:
+            # Different tags for this row: a local stream copy with its own metadata
+            task.status = "Adding Metadata"
+            self.listener.status_changed(task)
+            self.copy_with_metadata(source.filename, task)
+            task.status = "Completed (Copied)"
+        result = verify_file(task.filename, task.duration)
+        self.manifest.record(task.filename, result)
+        if result['error']:
+            os.remove(task.filename)
+            raise ValueError(f"Corrupt copy ({result['error']})")
+        self.directory_index.add(task.filename)
+        if self.journaled(source, task):
+            self.journal.record(task, completed=True, force=True)
+        self.metrics.increment("downloads_total", status="duplicate")
+        self.metrics.increment("duplicate_bytes_saved_total", result['size'])
+        with self.stats_lock:
+            self.dedup_downloads_saved += 1
+            self.dedup_bytes_saved += result['size']
+
+    def fail_duplicates(self, source):
+        with self.slot_available:
+            duplicates = self.duplicates.pop(source, None)
+        for task in duplicates or []:
+            task.status = f"Error: duplicate of row {source.index + 1}, which failed"
+            if self.journaled(source, task):
+                self.journal.record(task, force=True)
+            self.listener.status_changed(task)
+
+    def same_tags(self, task, other):
+        return (self.metadata_args(task.title, task.speaker, task.sermon_series, task.year) ==
+                self.metadata_args(other.title, other.speaker, other.sermon_series, other.year))
+
+    def journaled(self, source, task):
+        return source is task or (task.url, task.title) != (source.url, source.title)
+
+    def download_info(self, ydl, task):
+        cached = self.info_cache.get(self.cache_key(task))
+        if cached is not None:
+            try:
+                return ydl.process_ie_result(cached, download=True)
+            except yt_dlp.utils.DownloadError:
+                if task.terminated:
+                    raise
+                # Most likely expired stream URLs; extract fresh info and try once more
+                self.info_cache.invalidate(self.cache_key(task))
+        info = ydl.extract_info(task.url, download=True)
+        self.info_cache.put(self.cache_key(task), ydl.sanitize_info(info))
+        return info
+
+    def progress_hook(self, d, task, slot):
+        if task.terminated:
+            raise yt_dlp.utils.DownloadError("Download terminated by user")
+        if task.paused:
+            # Block the download loop in place; the open connection and byte offset survive the pause
+            self.journal.record(task, force=True)
+            self.bandwidth.unregister(task)
+            task.resume_event.wait()
+            if task.terminated:
+                raise yt_dlp.utils.DownloadError("Download terminated by user")
+            self.bandwidth.register(task)
+        task.partial_file = d.get('tmpfilename', task.partial_file)
+        if d['status'] == 'downloading':
+            if d.get('downloaded_bytes') and self.metrics.in_span(task, "first_byte"):
+                self.metrics.end_span(task, "first_byte")
+                self.metrics.start_span(task, "transfer")
+            if 'downloaded_bytes' in d:
+                format_id = (d.get('info_dict') or {}).get('format_id')
+                # Parallel fragment threads report concurrently and slightly out of order
+                with self.stats_lock:
+                    if format_id != task.current_format:
+                        task.current_format = format_id
+                        if d['downloaded_bytes'] < task.downloaded_bytes:
+                            # A new format (e.g. the audio stream after the video) restarts the counter
+                            task.downloaded_bytes = 0
+                    received = max(d['downloaded_bytes'] - task.downloaded_bytes, 0)
+                    self.bytes_downloaded += received
+                    task.downloaded_bytes += received
+                # Sleeping here holds back yt-dlp's read loop, which throttles the connection itself
+                self.bandwidth.consume(task, received)
+            total_bytes = d.get('total_bytes') or d.get('total_bytes_estimate')
+            if 'downloaded_bytes' in d and total_bytes:
+                task.total_bytes = total_bytes
+                self.journal.record(task)
+                task.progress = (task.downloaded_bytes / total_bytes) * 100
+                task.eta = d.get('eta', 'N/A')
+                if isinstance(task.eta, (int, float)):
+                    task.eta = f"{int(task.eta)}s"
+                self.listener.task_updated(slot, task)
+        elif d['status'] == 'finished':
+            if task.process and task.fragmented is not False:
+                # The next format (or the retry of this one) picks up the current share of the connection budget
+                task.process.params['concurrent_fragment_downloads'] = self.connections.lease(
+                    task, len(self.active_slots))
+            task.progress = 100
+            task.eta = "0s"
+            self.listener.task_updated(slot, task)
+
+    def postprocessor_hook(self, d, task):
+        # yt-dlp's own ffmpeg merge of the video and audio streams
+        if d.get('postprocessor') != 'Merger':
+            return
+        if d['status'] == 'started':
+            self.metrics.end_span(task, "transfer")
+            self.metrics.start_span(task, "merge")
+        elif d['status'] == 'finished':
+            self.metrics.end_span(task, "merge")
+
+    def metadata_args(self, title, speaker, sermon_series, year):
+        return [
+            "-metadata", f"title={title}",
+            "-metadata", f"artist={speaker}",
+            "-metadata", f"album={sermon_series}",
+            "-metadata", f"date={year}",
+        ]
+
+    def add_metadata(self, video_path, title, speaker, sermon_series, year):
+        root, ext = os.path.splitext(video_path)
+        output_path = f"{root}_meta{ext}"
+        try:
+            cmd = ["ffmpeg", "-i", video_path, "-c", "copy"]
+            cmd += self.metadata_args(title, speaker, sermon_series, year)
+            cmd.append(output_path)
+            subprocess.run(cmd, check=True, capture_output=True, text=True, timeout=300)
+            if not os.path.exists(output_path):
+                raise FileNotFoundError(f"Temporary file {output_path} was not created.")
+            os.remove(video_path)
+            os.rename(output_path, video_path)
+        except Exception as e:
+            print(f"Error updating metadata for {video_path}: {e}")
+            if os.path.exists(output_path):
+                os.remove(output_path)
+
+    def copy_with_metadata(self, source_path, task):
+        root, ext = os.path.splitext(task.filename)
+        output_path = f"{root}_meta{ext}"
+        try:
+            cmd = ["ffmpeg", "-i", source_path, "-map", "0", "-c", "copy"]
+            cmd += self.metadata_args(task.title, task.speaker, task.sermon_series, task.year)
+            cmd.append(output_path)
+            subprocess.run(cmd, check=True, capture_output=True, text=True, timeout=300)
+            os.rename(output_path, task.filename)
+        finally:
+            if os.path.exists(output_path):
+                os.remove(output_path)
+
+    def shutdown(self):
+        self.running = False
+        for task in self.download_tasks:
+            task.terminated = True
+            if task.resume_event:
+                task.resume_event.set()
+        with self.slot_available:
+            self.slot_available.notify_all()
+        self.executor.shutdown(wait=True)
+        self.postprocessor.shutdown(wait=True)
+        for ydl in self.downloaders:
+            ydl.close()
+        # Clean up temporary files; .part files are kept so the journal can resume them
+        if self.directory_index:
+            for temp_file in self.directory_index.temp_files():
+                try:
+                    os.remove(temp_file)
+                except Exception:
+                    pass
+        if self.journal:
+            self.journal.close()
+        if self.info_cache:
+            self.info_cache.close()
+        if self.manifest:
+            self.manifest.close()
+        self.metrics.close()
@@ -0,0 +1,46 @@
+import argparse
+import csv
+import os
+import sys
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmark import MediaServer, add_server_arguments  # noqa: E402
+from download_engine import RowStore  # noqa: E402
+
+
+@pytest.fixture
+def make_batch(tmp_path):
+    # Writes a CSV with one row per URL and returns its RowStore and an empty output directory
+    def make(urls):
+        csv_path = tmp_path / "batch.csv"
+        with open(csv_path, "w", newline="", encoding="utf-8") as file:
+            writer = csv.writer(file)
+            writer.writerow(["Title - Verses", "Date", "Speaker", "Sermon Series", "Sermon URL"])
+            for index, url in enumerate(urls):
+                writer.writerow([f"Sermon {index:04d}", "2024-01-07", "Test Speaker", "Test Series", url])
+        output_dir = tmp_path / "downloads"
+        output_dir.mkdir()
+        return RowStore.from_csv(str(csv_path)), str(output_dir)
+    return make
+
+
+@pytest.fixture
+def media_server():
+    # The benchmark's media server stand-in, run in a thread; returns the server and its base URL
+    servers = []
+
+    def start(*arguments):
+        parser = argparse.ArgumentParser()
+        add_server_arguments(parser)
+        server = MediaServer(("127.0.0.1", 0), parser.parse_args(list(arguments)))
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return server, f"http://127.0.0.1:{server.server_address[1]}"
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,47 @@
+import threading
+import time
+
+import pytest
+
+from download_engine import DownloadEngine
+
+pytest.importorskip("yt_dlp")
+
+MB = 1024 * 1024
+
+
+def sample_bytes(engine, samples, stop):
+    while not stop.is_set():
+        samples.append((time.monotonic(), engine.bytes_downloaded))
+        time.sleep(0.05)
+
+
+def steady_rate(samples, total, low=0.25, high=0.75):
+    # Rate between the moments low and high of all bytes had arrived. Each transfer's first buffer arrives
+    # before the limiter can delay it and the last ones finish at different times, so start-up and tail are left out
+    start = next(sample for sample in samples if sample[1] >= total * low)
+    end = next(sample for sample in samples if sample[1] >= total * high)
+    return (end[1] - start[1]) / (end[0] - start[0])
+
+
+@pytest.mark.parametrize("budget", [MB, 3 * MB])
+def test_throughput_stays_within_budget(make_batch, media_server, budget):
+    _, base_url = media_server()
+    size = budget  # Four seconds of transfer at the budget
+    rows, output_dir = make_batch([f"{base_url}/video/{size}/sermon{index}.mp4" for index in range(4)])
+    engine = DownloadEngine(max_concurrent_downloads=4, quiet=True, bandwidth_limit=budget)
+    engine.load_tasks(rows, output_dir)
+
+    samples = []
+    stop = threading.Event()
+    sampler = threading.Thread(target=sample_bytes, args=(engine, samples, stop), daemon=True)
+    sampler.start()
+    try:
+        engine.process_tasks()
+    finally:
+        stop.set()
+        sampler.join()
+        engine.shutdown()
+
+    assert engine.bytes_downloaded >= 4 * size
+    assert abs(steady_rate(samples, 4 * size) - budget) / budget < 0.05
@@ -0,0 +1,46 @@
+import pytest
+
+from download_engine import canonical_url
+
+
+@pytest.mark.parametrize("url", [
+    "https://www.youtube.com/watch?v=dQw4w9WgXcQ",
+    "https://youtube.com/watch?v=dQw4w9WgXcQ&t=42s",
+    "https://www.youtube.com/watch?list=PL123&v=dQw4w9WgXcQ&index=3",
+    "https://m.youtube.com/watch?v=dQw4w9WgXcQ&feature=share",
+    "https://music.youtube.com/watch?v=dQw4w9WgXcQ&si=abc",
+    "https://youtu.be/dQw4w9WgXcQ",
+    "https://youtu.be/dQw4w9WgXcQ?t=10&si=xyz",
+    "http://www.youtube.com/shorts/dQw4w9WgXcQ",
+    "https://www.youtube.com/embed/dQw4w9WgXcQ?start=5",
+    "https://www.youtube-nocookie.com/embed/dQw4w9WgXcQ",
+    "https://www.youtube.com/live/dQw4w9WgXcQ?feature=shared",
+    " https://www.youtube.com/v/dQw4w9WgXcQ ",
+])
+def test_youtube_forms_share_a_key(url):
+    assert canonical_url(url) == "youtube:dQw4w9WgXcQ"
+
+
+def test_different_youtube_videos_stay_distinct():
+    assert canonical_url("https://youtu.be/dQw4w9WgXcQ") != canonical_url("https://youtu.be/9bZkp7q19f0")
+
+
+@pytest.mark.parametrize("first, second", [
+    ("https://church.org/player.php?list=2023&index=4", "https://church.org/player.php?list=2023&index=5"),
+    ("https://cdn.example.com/v.mp4?t=abc", "https://cdn.example.com/v.mp4?t=def"),
+    ("https://cdn.example.com/v.mp4?start=1", "https://cdn.example.com/v.mp4"),
+    ("https://vimeo.com/123", "https://vimeo.com/124"),
+    ("https://church.org/media?id=1", "https://church.org/media?id=2"),
+    ("https://church.org:8080/a.mp4", "https://church.org/a.mp4"),
+])
+def test_other_sites_keep_their_query(first, second):
+    assert canonical_url(first) != canonical_url(second)
+
+
+@pytest.mark.parametrize("first, second", [
+    ("https://church.org/media?b=2&a=1", "http://www.church.org/media/?a=1&b=2"),
+    ("https://church.org/a.mp4?utm_source=mail", "https://church.org/a.mp4"),
+    ("https://church.org/a.mp4#t=30", "https://church.org/a.mp4"),
+])
+def test_other_sites_ignore_spelling(first, second):
+    assert canonical_url(first) == canonical_url(second)
@@ -0,0 +1,124 @@
+import threading
+import time
+
+from download_engine import ConcurrencyController, DownloadEngine, EngineListener, RetryPolicy
+
+MB = 1024 * 1024
+
+
+class SimulatedLink:
+    # Fake download backend: each connection gets at most per_connection bytes/s and all of them share a cap
+    def __init__(self, cap, per_connection, throttle_above=None):
+        self.cap = cap
+        self.per_connection = per_connection
+        self.throttle_above = throttle_above  # Above this many transfers the server answers with 429s
+        self.lock = threading.Lock()
+        self.active = 0
+
+    def rate(self, active):
+        return min(self.per_connection * active, self.cap)
+
+    def download(self, engine, task, slot, size, tick=0.02):
+        with self.lock:
+            self.active += 1
+        try:
+            received = 0
+            while received < size:
+                time.sleep(tick)
+                with self.lock:
+                    active = self.active
+                if self.throttle_above and active > self.throttle_above:
+                    error = Exception("HTTP Error 429: Too Many Requests")
+                    engine.controller.record_error()
+                    if not engine.schedule_retry(task, error):
+                        task.status = f"Error: {error}"
+                    return
+                chunk = min(size - received, int(self.rate(active) / active * tick))
+                received += chunk
+                with engine.stats_lock:
+                    engine.bytes_downloaded += chunk
+            engine.controller.record_success()
+            task.status = "Completed"
+        finally:
+            with self.lock:
+                self.active -= 1
+            engine.clear_slot(slot, task)
+
+
+class LimitHistory(EngineListener):
+    def __init__(self, initial):
+        self.limits = [initial]
+
+    def concurrency_changed(self, limit):
+        self.limits.append(limit)
+
+
+def simulate_windows(controller, link, windows, errors=0):
+    # Feeds the controller one measurement window at a time, as if every allowed slot stayed busy
+    total = 0
+    for _ in range(windows):
+        total += int(link.rate(controller.limit) * controller.interval)
+        for _ in range(errors):
+            controller.record_error()
+        controller.record_success()
+        controller.last_check = time.monotonic() - controller.interval
+        controller.update(total, saturated=True)
+    return controller.limit
+
+
+def test_controller_settles_at_bandwidth_cap():
+    link = SimulatedLink(cap=8 * MB, per_connection=MB)
+    controller = ConcurrencyController(1, 32, initial=2, interval=1.0)
+    limit = simulate_windows(controller, link, windows=40)
+    # One download past the point where the cap stops throughput from growing, and no further
+    assert 8 <= limit <= 9
+
+
+def test_controller_stays_within_bounds():
+    link = SimulatedLink(cap=100 * MB, per_connection=MB)
+    controller = ConcurrencyController(2, 6, initial=2, interval=1.0)
+    assert simulate_windows(controller, link, windows=20) == 6
+    assert simulate_windows(controller, link, windows=10, errors=5) == 2
+
+
+def test_controller_halves_on_errors():
+    link = SimulatedLink(cap=8 * MB, per_connection=MB)
+    controller = ConcurrencyController(1, 16, initial=8, interval=1.0)
+    assert simulate_windows(controller, link, windows=1, errors=1) == 4
+
+
+def run_simulated_batch(make_batch, link, tasks, size, min_limit, max_limit, initial):
+    rows, output_dir = make_batch([f"https://example.com/video/{index}" for index in range(tasks)])
+    listener = LimitHistory(initial)
+    engine = DownloadEngine(max_concurrent_downloads=max_limit, min_concurrent_downloads=min_limit,
+                            initial_concurrent_downloads=initial, listener=listener, quiet=True,
+                            retry_policy=RetryPolicy(max_attempts=50, base_delay=0.05, max_delay=0.1))
+    engine.controller.interval = 0.2
+    engine.load_tasks(rows, output_dir)
+    for task in engine.download_tasks:
+        engine.info_cache.put(engine.cache_key(task), {'duration': 60, 'filesize': size})
+    engine.download_video = lambda task, slot: link.download(engine, task, slot, size)
+    engine.process_tasks()
+    engine.shutdown()
+    return engine, listener.limits
+
+
+def test_engine_ramps_up_to_the_link(make_batch):
+    link = SimulatedLink(cap=4 * MB, per_connection=MB // 2)
+    engine, limits = run_simulated_batch(make_batch, link, tasks=120, size=128 * 1024,
+                                         min_limit=1, max_limit=16, initial=2)
+    assert all(task.status == "Completed" for task in engine.download_tasks)
+    # Eight connections fill the simulated link; the controller should find that without hitting the maximum
+    assert max(limits) >= 6
+    assert max(limits) < 16
+
+
+def test_engine_backs_off_when_throttled(make_batch):
+    link = SimulatedLink(cap=16 * MB, per_connection=MB, throttle_above=4)
+    engine, limits = run_simulated_batch(make_batch, link, tasks=80, size=64 * 1024,
+                                         min_limit=1, max_limit=8, initial=8)
+    assert all(task.status == "Completed" for task in engine.download_tasks)
+    assert any(later < earlier for earlier, later in zip(limits, limits[1:]))
+    assert all(1 <= limit <= 8 for limit in limits)
+    # The tail of the batch has too few tasks left to trigger 429s, so the limit may creep back up by then
+    assert min(limits) <= 4
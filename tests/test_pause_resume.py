@@ -0,0 +1,108 @@
+import threading
+import time
+
+import pytest
+
+from download_engine import DownloadEngine, EngineListener
+
+pytest.importorskip("yt_dlp")
+
+MB = 1024 * 1024
+
+
+class DownloadStarted(EngineListener):
+    def __init__(self, server):
+        self.server = server
+        self.transfers_before = None
+        self.started = threading.Event()
+
+    def task_updated(self, slot, task):
+        if task.status == "Downloading" and not self.started.is_set():
+            # Anything the server sends from here on belongs to the download, not to pre-flight extraction
+            with self.server.lock:
+                self.transfers_before = len(self.server.transfers)
+            self.started.set()
+
+
+def wait_for(condition, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.005)
+
+
+def test_resume_continues_the_same_transfer(make_batch, media_server):
+    # Throttled so the pause lands in the middle of the transfer
+    server, base_url = media_server("--throttle", str(MB))
+    size = 3 * MB
+    rows, output_dir = make_batch([f"{base_url}/video/{size}/sermon.mp4"])
+    listener = DownloadStarted(server)
+    engine = DownloadEngine(max_concurrent_downloads=1, quiet=True, listener=listener)
+    engine.load_tasks(rows, output_dir)
+    task = engine.download_tasks[0]
+
+    worker = threading.Thread(target=engine.process_tasks, daemon=True)
+    worker.start()
+    try:
+        wait_for(lambda: task.downloaded_bytes > MB // 2)
+        engine.toggle_pause(0)
+        time.sleep(0.2)
+        paused_at = task.downloaded_bytes
+        time.sleep(1.0)
+        assert task.status == "Paused"
+        assert task.downloaded_bytes == paused_at
+
+        resumed = time.monotonic()
+        engine.toggle_pause(0)
+        wait_for(lambda: task.downloaded_bytes > paused_at)
+        resume_latency = time.monotonic() - resumed
+        worker.join(timeout=30)
+    finally:
+        engine.shutdown()
+
+    assert not worker.is_alive()
+    assert task.status == "Completed"
+    assert resume_latency < 0.25
+    # One request, read to the end once: nothing was fetched twice
+    transfers = server.transfers[listener.transfers_before:]
+    assert len(transfers) == 1
+    assert transfers[0][2] - size == 0
+
+
+class PauseOnDispatch(EngineListener):
+    def __init__(self):
+        self.engine = None
+        self.paused = threading.Event()
+
+    def task_updated(self, slot, task):
+        # Pause before download_video has built its YoutubeDL or opened a connection, like "Pause All" after "Start"
+        if task.status == "Downloading" and not self.paused.is_set():
+            self.paused.set()
+            self.engine.toggle_pause(slot)
+
+
+def test_pause_right_after_dispatch_waits_for_resume(make_batch, media_server):
+    server, base_url = media_server()
+    size = MB
+    rows, output_dir = make_batch([f"{base_url}/video/{size}/sermon.mp4"])
+    listener = PauseOnDispatch()
+    engine = DownloadEngine(max_concurrent_downloads=1, quiet=True, listener=listener)
+    listener.engine = engine
+    engine.load_tasks(rows, output_dir)
+    task = engine.download_tasks[0]
+
+    worker = threading.Thread(target=engine.process_tasks, daemon=True)
+    worker.start()
+    try:
+        assert listener.paused.wait(10)
+        time.sleep(0.5)
+        assert worker.is_alive()
+        assert task.status == "Paused"
+        assert task.downloaded_bytes == 0
+        engine.resume_all()
+        worker.join(timeout=30)
+    finally:
+        engine.shutdown()
+
+    assert not worker.is_alive()
+    assert task.status == "Completed"
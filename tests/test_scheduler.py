@@ -0,0 +1,69 @@
+import threading
+import time
+
+from download_engine import DownloadEngine
+
+BATCH_SIZE = 500
+SLOTS = 10
+
+
+def test_blocked_batch_uses_no_cpu(make_batch):
+    rows, output_dir = make_batch([f"https://example.com/video/{index}" for index in range(BATCH_SIZE)])
+    engine = DownloadEngine(max_concurrent_downloads=SLOTS, quiet=True)
+    engine.load_tasks(rows, output_dir)
+    # Pre-flight reads the info cache first, so the batch never reaches yt-dlp
+    for task in engine.download_tasks:
+        engine.info_cache.put(engine.cache_key(task), {'duration': 60, 'filesize': 1024})
+
+    release = threading.Event()
+    started = threading.Semaphore(0)
+
+    def blocked_download(task, slot):
+        started.release()
+        release.wait()
+        task.status = "Completed"
+        engine.clear_slot(slot, task)
+
+    engine.download_video = blocked_download
+    scheduler = threading.Thread(target=engine.process_tasks, daemon=True)
+    scheduler.start()
+    try:
+        for _ in range(SLOTS):
+            assert started.acquire(timeout=10)
+        # Every slot is busy and 490 tasks are queued; the scheduler should be asleep on its condition
+        cpu_before = time.process_time()
+        time.sleep(1.0)
+        cpu = time.process_time() - cpu_before
+    finally:
+        release.set()
+        scheduler.join(timeout=30)
+        engine.shutdown()
+
+    assert not scheduler.is_alive()
+    assert cpu < 0.05
+    assert all(task.status == "Completed" for task in engine.download_tasks)
+
+
+def test_freed_slot_is_refilled_within_milliseconds(make_batch):
+    rows, output_dir = make_batch([f"https://example.com/video/{index}" for index in range(50)])
+    engine = DownloadEngine(max_concurrent_downloads=1, quiet=True)
+    engine.load_tasks(rows, output_dir)
+    for task in engine.download_tasks:
+        engine.info_cache.put(engine.cache_key(task), {'duration': 60, 'filesize': 1024})
+
+    gaps = []
+    last_finished = []
+
+    def instant_download(task, slot):
+        if last_finished:
+            gaps.append(time.monotonic() - last_finished[0])
+        task.status = "Completed"
+        last_finished[:] = [time.monotonic()]
+        engine.clear_slot(slot, task)
+
+    engine.download_video = instant_download
+    engine.process_tasks()
+    engine.shutdown()
+
+    assert len(gaps) == 49
+    assert sorted(gaps)[len(gaps) // 2] < 0.01
@@ -0,0 +1,28 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+from benchmark import parse_importtime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.mark.parametrize("module", ["download_engine", "download_cli"])
+def test_headless_import_skips_yt_dlp_and_tkinter(module):
+    # A fresh interpreter, the way the CLI starts; yt-dlp loads lazily and tkinter belongs to the GUI only
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c",
+         f"import sys, {module}; print(' '.join(sorted(sys.modules)))"],
+        capture_output=True, text=True, cwd=ROOT, check=True
+    )
+    entries = parse_importtime(process.stderr)
+    print(f"{module}: slowest imports")
+    for cumulative_us, self_us, depth, name in sorted(entries, reverse=True)[:10]:
+        print(f"  {cumulative_us / 1000:9.1f} ms cumulative {self_us / 1000:8.1f} ms self  {'  ' * depth}{name}")
+
+    loaded = set(process.stdout.split())
+    assert module in loaded
+    for heavy in ("yt_dlp", "tkinter", "_tkinter"):
+        assert heavy not in loaded
@@ -0,0 +1,39 @@
+import shutil
+import subprocess
+
+import pytest
+
+from download_engine import IntegrityManifest, verify_file
+
+pytestmark = pytest.mark.skipif(not (shutil.which("ffmpeg") and shutil.which("ffprobe")),
+                                reason="needs ffmpeg and ffprobe")
+
+
+@pytest.fixture
+def video(tmp_path):
+    path = tmp_path / "sermon.mp4"
+    subprocess.run(["ffmpeg", "-loglevel", "error", "-f", "lavfi", "-i", "color=size=64x64:rate=1",
+                    "-f", "lavfi", "-i", "anullsrc", "-t", "1", "-c:v", "libx264", "-c:a", "aac", "-y", str(path)],
+                   check=True, capture_output=True)
+    return path
+
+
+def test_duration_mismatch_is_only_a_warning(tmp_path, video):
+    result = verify_file(str(video), expected_duration=3600)
+    assert result['error'] is None
+    assert "expected 3600s" in result['warning']
+
+    manifest = IntegrityManifest(str(tmp_path))
+    manifest.record(str(video), result)
+    assert manifest.verified(str(video))
+    manifest.close()
+
+
+def test_truncated_and_empty_files_are_errors(tmp_path, video):
+    truncated = tmp_path / "truncated.mp4"
+    truncated.write_bytes(video.read_bytes()[:1000])
+    assert verify_file(str(truncated))['error']
+
+    empty = tmp_path / "empty.mp4"
+    empty.write_bytes(b"")
+    assert verify_file(str(empty))['error'] == "empty file"